@@ -8,7 +8,7 @@ EA จะ poll คำสั่งผ่าน REST API แทน
 import logging
 import time
 import threading
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from collections import defaultdict, deque
 
@@ -94,6 +94,51 @@ class CommandQueue:
             logger.error(f"[COMMAND_QUEUE] ❌ Failed to add command for {account}: {e}", exc_info=True)
             return False
 
+    def add_commands_bulk(self, commands: List[Tuple[str, Dict]]) -> List[bool]:
+        """
+        เพิ่มหลายคำสั่งเข้า queue ในครั้งเดียว (lock ครั้งเดียวต่อ account)
+
+        Args:
+            commands: รายการ (account, command)
+
+        Returns:
+            List[bool]: True สำหรับแต่ละคำสั่งที่เพิ่มสำเร็จ (ตามลำดับเดิม)
+        """
+        results = [False] * len(commands)
+        now = time.time()
+        now_iso = datetime.now().isoformat()
+
+        # จัดกลุ่มตาม account
+        by_account: Dict[str, List[Tuple[int, Dict]]] = defaultdict(list)
+        for index, (account, command) in enumerate(commands):
+            account = str(account).strip()
+            by_account[account].append((index, {
+                **command,
+                'queue_id': f"{account}_{int(now * 1000)}_{id(command)}",
+                'queue_timestamp': now_iso,
+                'queue_added_at': now,
+                'acknowledged': False
+            }))
+
+        for account, enriched in by_account.items():
+            try:
+                with self._locks[account]:
+                    self._queues[account].extend(cmd for _, cmd in enriched)
+                    self._stats['total_commands_added'] += len(enriched)
+
+                for index, cmd in enriched:
+                    results[index] = True
+                    logger.info(
+                        f"[COMMAND_QUEUE] ✅ Added command for {account}: "
+                        f"{cmd.get('action')} {cmd.get('symbol')} "
+                        f"(queue_id={cmd['queue_id']})"
+                    )
+
+            except Exception as e:
+                logger.error(f"[COMMAND_QUEUE] ❌ Failed to add commands for {account}: {e}", exc_info=True)
+
+        return results
+
     def get_pending_commands(self, account: str, limit: int = 10, auto_ack: bool = True) -> List[Dict]:
         """
         ดึงคำสั่งที่รออยู่สำหรับ account นี้
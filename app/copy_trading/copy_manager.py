@@ -12,6 +12,9 @@ import logging
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from app.core.db_pool import get_pool
+from app.core.database_init import sync_copy_pairs_table
+
 logger = logging.getLogger(__name__)
 
 class CopyManager:
@@ -51,6 +54,20 @@ class CopyManager:
             logger.info("[COPY_MANAGER] Pairs saved successfully")
         except Exception as e:
             logger.error(f"[COPY_MANAGER] Failed to save pairs: {e}")
+            return
+
+        self._sync_pairs_table()
+
+    def _sync_pairs_table(self):
+        """อัปเดตตาราง copy_pairs ใน SQLite ให้ตรงกับไฟล์ (ใช้นับ pairs ต่อ user)"""
+        db_path = os.path.abspath(os.path.join(self.data_dir, "accounts.db"))
+        if not os.path.exists(db_path):
+            return
+        try:
+            with get_pool(db_path).get_conn() as conn:
+                sync_copy_pairs_table(conn, self.pairs)
+        except Exception as e:
+            logger.warning(f"[COPY_MANAGER] Failed to sync copy_pairs table: {e}")
     
     def _load_api_keys(self) -> Dict:
         """โหลด API Keys mapping"""
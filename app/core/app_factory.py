@@ -3,6 +3,7 @@ Application Factory
 Creates and configures the Flask application with all services and routes
 """
 import os
+import atexit
 import logging
 import threading
 from flask import Flask
@@ -149,13 +150,12 @@ def create_app():
     from app.services.system_logs_service import SystemLogsService
     from app.services.account_allowlist_service import AccountAllowlistService
     from app.services.webhook_service import WebhookService
-    from app.services.settings_service import SettingsService
-    from app.services.user_service import UserService  # Domain + License Key system
+    from app.services.settings_service import settings_service  # Shared with the rate limiter
+    from app.services.user_service import user_service  # Domain + License Key system
 
     # Initialize services
     system_logs_service = SystemLogsService()
     account_allowlist_service = AccountAllowlistService()
-    user_service = UserService()  # License key management
     logger.info("[APP_FACTORY] UserService initialized (License Key support)")
 
     # Helper function for recording trades (used by webhook)
@@ -170,7 +170,9 @@ def create_app():
     )
     logger.info("[APP_FACTORY] ✅ WebhookService initialized with command_queue")
 
-    settings_service = SettingsService()
+    # Close pooled SQLite connections on shutdown
+    from app.core.db_pool import close_all_pools
+    atexit.register(close_all_pools)
 
     logger.info("[APP_FACTORY] Services initialized")
 
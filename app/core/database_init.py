@@ -9,6 +9,7 @@ This module handles:
 2. Auto-migration of legacy data to Multi-User format
 3. Generating missing webhook tokens for users
 4. Migrating copy_pairs.json with user_id
+5. Mirroring copy_pairs.json into the copy_pairs table
 
 NO MANUAL MIGRATION SCRIPTS REQUIRED - everything runs on app startup!
 """
@@ -136,6 +137,73 @@ def _migrate_copy_pairs_user_id() -> int:
     return migrated
 
 
+def sync_copy_pairs_table(conn, pairs: List[Dict]) -> int:
+    """
+    Mirror copy pairs into the copy_pairs table.
+
+    copy_pairs.json stays the source of truth; the table only lets
+    per-user counts run as an indexed COUNT(*) instead of a file scan.
+
+    Args:
+        conn: SQLite connection
+        pairs: Pair dictionaries as stored in copy_pairs.json
+
+    Returns:
+        int: Number of rows written
+    """
+    rows = [
+        (
+            str(p.get('id')),
+            p.get('user_id'),
+            p.get('master_account'),
+            p.get('slave_account'),
+            p.get('status'),
+            p.get('created')
+        )
+        for p in pairs if p.get('id')
+    ]
+
+    conn.execute("BEGIN")
+    try:
+        conn.execute("DELETE FROM copy_pairs")
+        conn.executemany("""
+            INSERT OR REPLACE INTO copy_pairs (id, user_id, master_account, slave_account, status, created)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return len(rows)
+
+
+def _sync_copy_pairs_from_json() -> int:
+    """
+    Load copy_pairs.json into the copy_pairs table.
+    Called automatically during startup.
+    """
+    copy_pairs_file = get_data_dir() / 'copy_pairs.json'
+
+    try:
+        pairs = []
+        if copy_pairs_file.exists():
+            with open(copy_pairs_file, 'r', encoding='utf-8') as f:
+                pairs = json.load(f)
+            if not isinstance(pairs, list):
+                return 0
+
+        conn = sqlite3.connect(str(get_database_path()), isolation_level=None)
+        try:
+            return sync_copy_pairs_table(conn, pairs)
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.debug(f"[DB_INIT] Copy pairs table sync: {e}")
+
+    return 0
+
+
 def _migrate_master_slave_accounts_user_id() -> int:
     """
     Auto-migrate master_accounts.json and slave_accounts.json entries without user_id.
@@ -295,6 +363,7 @@ def run_auto_migrations() -> Dict:
 
         # Migrate JSON files (separate from DB connection)
         results['copy_pairs_migrated'] = _migrate_copy_pairs_user_id()
+        _sync_copy_pairs_from_json()
         results['master_slave_migrated'] = _migrate_master_slave_accounts_user_id()
 
         # Log summary if anything was migrated
@@ -390,9 +459,24 @@ def ensure_database_schema() -> bool:
                 webhook_token TEXT UNIQUE NOT NULL,
                 webhook_url TEXT,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                expires_at TEXT,
+                last_used TEXT,
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
         ''')
+
+        # Check if expires_at column exists (for legacy databases)
+        cursor.execute("PRAGMA table_info(user_tokens)")
+        token_columns = [col[1] for col in cursor.fetchall()]
+
+        if 'expires_at' not in token_columns:
+            cursor.execute('ALTER TABLE user_tokens ADD COLUMN expires_at TEXT')
+            logger.info("[DB_INIT] Added 'expires_at' column to user_tokens")
+
+        if 'last_used' not in token_columns:
+            cursor.execute('ALTER TABLE user_tokens ADD COLUMN last_used TEXT')
+            logger.info("[DB_INIT] Added 'last_used' column to user_tokens")
+
         logger.debug("[DB_INIT] ✓ Table 'user_tokens' ready")
 
         # ========================================
@@ -489,12 +573,49 @@ def ensure_database_schema() -> bool:
         ''')
         logger.debug("[DB_INIT] ✓ Table 'sessions' ready")
 
+        # ========================================
+        # TABLE 6: copy_pairs (mirror of copy_pairs.json for counts)
+        # ========================================
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS copy_pairs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                master_account TEXT,
+                slave_account TEXT,
+                status TEXT,
+                created TEXT
+            )
+        ''')
+        logger.debug("[DB_INIT] ✓ Table 'copy_pairs' ready")
+
         # ========================================
         # Create indexes for performance
         # ========================================
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_accounts_user_id ON accounts(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_tokens_user_id ON user_tokens(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)')
+        try:
+            # One token per user (lets TokenService upsert on user_id)
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_user_tokens_user_unique ON user_tokens(user_id)')
+            cursor.execute('DROP INDEX IF EXISTS idx_user_tokens_user_id')
+        except sqlite3.IntegrityError:
+            logger.warning("[DB_INIT] Users with multiple webhook tokens found; user_id index left non-unique")
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_tokens_user_id ON user_tokens(user_id)')
+        # webhook_token and email are UNIQUE columns, so SQLite already keeps an
+        # index on each; drop the older explicit copies
+        cursor.execute('DROP INDEX IF EXISTS idx_user_tokens_token')
+        cursor.execute('DROP INDEX IF EXISTS idx_user_tokens_user')
+        cursor.execute('DROP INDEX IF EXISTS idx_user_tokens_webhook_token')
+        cursor.execute('DROP INDEX IF EXISTS idx_users_email')
+        # Expiry is checked in Python after the webhook_token lookup
+        cursor.execute('DROP INDEX IF EXISTS idx_user_tokens_expires')
+        try:
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE)')
+        except sqlite3.IntegrityError:
+            logger.warning("[DB_INIT] Emails differing only by case found; NOCASE email index not created")
+        try:
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_license_key ON users(license_key) WHERE license_key IS NOT NULL')
+        except sqlite3.IntegrityError:
+            logger.warning("[DB_INIT] Duplicate license keys found; license_key index not created")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_copy_pairs_user_id ON copy_pairs(user_id)')
         logger.debug("[DB_INIT] ✓ Indexes ready")
 
         # ========================================
@@ -0,0 +1,208 @@
+"""
+SQLite Connection Pool
+Shares a bounded set of long-lived sqlite3 connections per database file
+
+Each pool has a single writer connection and up to max_size read-only
+reader connections (opened with mode=ro and a larger mmap window). SQLite allows one writer at a time, so serializing
+writes in-process avoids lock contention while readers run in parallel
+under WAL.
+
+    with self._pool.get_conn() as conn:    # writer (reads + writes)
+        conn.execute(...)
+
+    with self._pool.read_conn() as conn:   # reader (SELECT only)
+        conn.execute(...)
+
+Connections are opened lazily in autocommit mode, so a multi-statement
+transaction must be started explicitly with BEGIN.
+"""
+import queue
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+
+# Per-connection prepared statement cache (sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+# Applied to every new connection (WAL lets readers run alongside a writer)
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Applied after CONNECTION_PRAGMAS on reader connections
+READER_PRAGMAS = (
+    "PRAGMA query_only=ON",
+    "PRAGMA mmap_size=1073741824",
+)
+
+
+class ConnectionPool:
+    """Single writer plus a bounded pool of readers for one database file"""
+
+    def __init__(self, db_path: str, max_size: int = DEFAULT_POOL_SIZE):
+        self.db_path = db_path
+        self.max_size = max_size
+        self._idle = queue.Queue(maxsize=max_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._wal_enabled = False
+
+        self._writer = None
+        self._writer_depth = 0
+        self._writer_lock = threading.RLock()
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """Open and configure a new connection"""
+        if read_only:
+            # mode=ro needs the file to exist and WAL to be set already,
+            # so make sure the writer has opened the database first
+            if not self._wal_enabled:
+                with self.get_conn():
+                    pass
+            target = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        else:
+            target = self.db_path
+
+        conn = sqlite3.connect(
+            target,
+            uri=read_only,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+
+        # journal_mode is stored in the database file, so set it only once
+        if not read_only and not self._wal_enabled:
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._wal_enabled = True
+
+        # The rest are per-connection settings
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
+        if read_only:
+            for pragma in READER_PRAGMAS:
+                conn.execute(pragma)
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        """Take an idle reader, open a new one, or wait for one to be returned"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.max_size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self._connect(read_only=True)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        return self._idle.get()
+
+    def _release(self, conn: sqlite3.Connection):
+        """Return a reader to the pool, discarding any open transaction"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except Exception as e:
+            logger.warning(f"[DB_POOL] Dropping connection: {e}")
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def get_conn(self) -> Iterator[sqlite3.Connection]:
+        """
+        Hold the writer connection for the duration of a with-block.
+
+        Re-entrant within a thread; other threads wait for the block to end.
+        """
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+
+            self._writer_depth += 1
+            try:
+                yield self._writer
+            finally:
+                self._writer_depth -= 1
+                # Don't leak a forgotten transaction to the next writer
+                if self._writer_depth == 0 and self._writer.in_transaction:
+                    self._writer.rollback()
+
+    @contextmanager
+    def read_conn(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection for the duration of a with-block"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close_all(self):
+        """Close the writer and all idle readers (call on shutdown)"""
+        with self._writer_lock:
+            if self._writer is not None and self._writer_depth == 0:
+                try:
+                    self._writer.close()
+                except Exception:
+                    pass
+                self._writer = None
+
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Get the shared connection pool for a database file"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            _pools[db_path] = pool
+        return pool
+
+
+def close_all_pools():
+    """Close idle connections in every pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+
+    for pool in pools:
+        pool.close_all()
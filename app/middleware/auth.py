@@ -132,8 +132,7 @@ def get_current_user_id() -> Optional[str]:
     # Fallback for legacy sessions - find first admin user from database
     if session.get('auth'):
         try:
-            from app.services.user_service import UserService
-            user_service = UserService()
+            from app.services.user_service import user_service
             admin_user = user_service.get_first_admin()
             if admin_user:
                 return admin_user.get('user_id', 'admin_001')
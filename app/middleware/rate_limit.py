@@ -41,8 +41,7 @@ def get_command_api_rate_limit():
         str: Rate limit string (e.g., '60 per minute')
     """
     try:
-        from app.services.settings_service import SettingsService
-        settings_service = SettingsService()
+        from app.services.settings_service import settings_service
         settings = settings_service.load_settings()
         return settings.get('rate_limits', {}).get('command_api', '60 per minute')
     except Exception:
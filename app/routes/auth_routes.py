@@ -51,8 +51,8 @@ def google_callback():
     Per MIGRATION_ROADMAP.md Phase 2.4
     """
     from app.services.google_oauth_service import GoogleOAuthService
-    from app.services.user_service import UserService
-    from app.services.token_service import TokenService
+    from app.services.user_service import user_service
+    from app.services.token_service import token_service
 
     # Get code and state from callback
     code = request.args.get('code')
@@ -76,8 +76,6 @@ def google_callback():
 
     try:
         oauth_service = GoogleOAuthService()
-        user_service = UserService()
-        token_service = TokenService()
 
         # Exchange code for tokens
         token_data = oauth_service.exchange_code_for_token(code)
@@ -167,7 +165,7 @@ def get_webhook_token():
     """
     Get current user's webhook token and URL.
     """
-    from app.services.token_service import TokenService
+    from app.services.token_service import token_service
     from app.middleware.auth import get_current_user_id
 
     user_id = get_current_user_id()
@@ -175,7 +173,6 @@ def get_webhook_token():
     if not user_id:
         return jsonify({'error': 'Not authenticated'}), 401
 
-    token_service = TokenService()
     webhook_url = token_service.get_webhook_url(user_id)
 
     return jsonify({
@@ -189,7 +186,7 @@ def rotate_webhook_token():
     """
     Generate new webhook token for current user.
     """
-    from app.services.token_service import TokenService
+    from app.services.token_service import token_service
     from app.middleware.auth import get_current_user_id
 
     user_id = get_current_user_id()
@@ -197,7 +194,6 @@ def rotate_webhook_token():
     if not user_id:
         return jsonify({'error': 'Not authenticated'}), 401
 
-    token_service = TokenService()
     new_token = token_service.rotate_token(user_id)
     webhook_url = token_service.get_webhook_url(user_id)
 
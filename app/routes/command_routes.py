@@ -3,11 +3,17 @@ Command Routes
 Handles EA command queue endpoints
 """
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from app.middleware.auth import session_login_required
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Create blueprint
 command_bp = Blueprint('command', __name__)
 
@@ -91,12 +97,17 @@ def get_commands_for_ea(account: str):
         else:
             logger.debug(f"[COMMAND_API] No commands for {account}")
 
-        return jsonify({
+        payload = {
             'success': True,
             'account': account,
             'commands': commands,
             'count': len(commands)
-        })
+        }
+
+        # EA polls this every 1-2 seconds; orjson encodes much faster than jsonify
+        if HAS_ORJSON:
+            return Response(orjson.dumps(payload), mimetype='application/json')
+        return jsonify(payload)
 
     except Exception as e:
         logger.error(f"[COMMAND_API] Error: {e}", exc_info=True)
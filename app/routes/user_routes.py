@@ -167,10 +167,11 @@ def get_license_key():
 
         if not credentials:
             # Generate if missing
-            license_key = user_service.regenerate_license_key(user_id)
-            webhook_secret = user_service.regenerate_webhook_secret(user_id)
-            if not license_key:
+            generated = user_service.regenerate_credentials(user_id)
+            if not generated:
                 return jsonify({'error': 'Failed to generate credentials'}), 500
+            license_key = generated['license_key']
+            webhook_secret = generated['webhook_secret']
             credentials = {
                 'license_key': license_key,
                 'webhook_secret': webhook_secret,
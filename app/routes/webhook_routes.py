@@ -87,8 +87,7 @@ def get_webhook_url():
     if user_id:
         # Multi-User SaaS: Return user-specific webhook URL using license_key
         try:
-            from app.services.user_service import UserService
-            user_service = UserService()
+            from app.services.user_service import user_service
 
             # Get user credentials which include license_key
             credentials = user_service.get_user_credentials(user_id)
@@ -180,8 +179,7 @@ def webhook_handler(token):
 
     # Try to find user by webhook token (Multi-User SaaS)
     try:
-        from app.services.token_service import TokenService
-        token_service = TokenService()
+        from app.services.token_service import token_service
         user_id = token_service.get_user_by_webhook_token(token)
 
         if user_id:
@@ -194,8 +192,7 @@ def webhook_handler(token):
         if LEGACY_WEBHOOK_TOKEN and token == LEGACY_WEBHOOK_TOKEN:
             # Find first admin user dynamically instead of hardcoding admin_001
             try:
-                from app.services.user_service import UserService
-                user_service = UserService()
+                from app.services.user_service import user_service
                 admin_user = user_service.get_first_admin()
                 user_id = admin_user.get('user_id') if admin_user else 'admin_001'
             except Exception:
@@ -357,6 +354,9 @@ def webhook_handler(token):
     target_accounts = data.get('accounts') or [data.get('account_number')]
     allowed, blocked = [], []
 
+    # One query for every target account instead of get_account_info per account
+    accounts_info = session_manager.get_accounts_info([str(acc).strip() for acc in target_accounts])
+
     for acc in target_accounts:
         acc_str = str(acc).strip()
 
@@ -382,7 +382,7 @@ def webhook_handler(token):
             continue
 
         # Check if account is PAUSED
-        account_info = session_manager.get_account_info(acc_str)
+        account_info = accounts_info.get(acc_str)
         if account_info and account_info.get("status") == "PAUSE":
             blocked.append(acc_str)
 
@@ -499,8 +499,7 @@ def _handle_ea_heartbeat(user_id: str, user_email: str, data: dict):
         return jsonify({'error': 'Account number required'}), 400
 
     # Get user's accounts
-    from app.services.user_service import UserService
-    user_svc = UserService()
+    from app.services.user_service import user_service as user_svc
     user_accounts = user_svc.get_user_accounts_list(user_id)
 
     # ⚠️ CHANGED: Do NOT auto-add accounts - user must add via Dashboard first
@@ -538,8 +537,7 @@ def _handle_ea_command_poll(user_id: str, user_email: str, data: dict):
         return jsonify({'error': 'Account number required'}), 400
 
     # Verify account belongs to user
-    from app.services.user_service import UserService
-    user_svc = UserService()
+    from app.services.user_service import user_service as user_svc
     user_accounts = user_svc.get_user_accounts_list(user_id)
 
     if account not in user_accounts:
@@ -576,8 +574,7 @@ def _handle_trading_signal_unified(user_id: str, user_email: str, data: dict):
     system_logs_service.add_log('info', f'📡 Signal: {action} {symbol} from {user_email}', user_id=user_id)
 
     # Get user's accounts
-    from app.services.user_service import UserService
-    user_svc = UserService()
+    from app.services.user_service import user_service as user_svc
     user_accounts = user_svc.get_user_accounts_list(user_id)
 
     if not user_accounts:
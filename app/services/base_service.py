@@ -0,0 +1,33 @@
+"""
+Base Service
+Shared SQLite access for services backed by data/accounts.db
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.core.db_pool import get_pool
+
+
+class BaseService:
+    """Base class for services that use the shared accounts database."""
+
+    def __init__(self):
+        self.data_dir = os.path.join(os.getcwd(), "data")
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.db_path = os.path.join(self.data_dir, "accounts.db")
+        self._pool = get_pool(self.db_path)
+
+    @contextmanager
+    def get_conn(self) -> Iterator[sqlite3.Connection]:
+        """Hold the shared writer connection for the duration of a with-block."""
+        with self._pool.get_conn() as conn:
+            yield conn
+
+    @contextmanager
+    def get_read_conn(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only pooled connection for the duration of a with-block."""
+        with self._pool.read_conn() as conn:
+            yield conn
@@ -194,5 +194,9 @@ class GoogleOAuthService:
         Returns:
             bool: True if valid
         """
-        return state == stored_state and bool(state)
+        if not state or not stored_state:
+            return False
+
+        # Constant-time comparison to prevent timing attacks
+        return secrets.compare_digest(state, stored_state)
 
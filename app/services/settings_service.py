@@ -2,16 +2,29 @@
 Settings Service
 Handles application settings management
 """
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime
+import threading
 import logging
+import copy
 import json
 import os
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 SETTINGS_FILE = 'data/settings.json'
 
+# Parsed settings per file: path -> (mtime_ns, settings), shared by all
+# SettingsService instances and invalidated when the file's mtime changes
+_settings_cache: Dict[str, Tuple[int, Dict]] = {}
+_settings_cache_lock = threading.Lock()
+
 
 class SettingsService:
     """Service for managing application settings"""
@@ -30,14 +43,22 @@ class SettingsService:
             dict: Settings dictionary
         """
         try:
-            if os.path.exists(self.settings_file):
+            try:
+                mtime = os.stat(self.settings_file).st_mtime_ns
+            except FileNotFoundError:
+                # Return default settings if file doesn't exist
+                return self._get_default_settings()
+
+            with _settings_cache_lock:
+                cached = _settings_cache.get(self.settings_file)
+                if cached is not None and cached[0] == mtime:
+                    return copy.deepcopy(cached[1])
+
                 with open(self.settings_file, 'r', encoding='utf-8') as f:
                     settings = json.load(f)
+                _settings_cache[self.settings_file] = (mtime, settings)
                 logger.info("[SETTINGS] Settings loaded successfully")
-                return settings
-            else:
-                # Return default settings if file doesn't exist
-                return self._get_default_settings()
+                return copy.deepcopy(settings)
         except Exception as e:
             logger.error(f"[SETTINGS] Error loading settings: {e}")
             return self._get_default_settings()
@@ -54,8 +75,25 @@ class SettingsService:
         """
         try:
             os.makedirs('data', exist_ok=True)
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(settings_data, f, indent=2, ensure_ascii=False)
+
+            # Write to a temp file and atomically swap it in so concurrent
+            # readers never see a truncated settings file
+            tmp_file = self.settings_file + '.tmp'
+            if HAS_ORJSON:
+                with open(tmp_file, 'wb') as f:
+                    f.write(orjson.dumps(
+                        settings_data,
+                        option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                    ))
+            else:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(settings_data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, self.settings_file)
+
+            with _settings_cache_lock:
+                _settings_cache[self.settings_file] = (
+                    os.stat(self.settings_file).st_mtime_ns, copy.deepcopy(settings_data)
+                )
             logger.info("[SETTINGS] Settings saved successfully")
             return True
         except Exception as e:
@@ -160,3 +198,6 @@ class SettingsService:
 
         return email_settings
 
+
+# Shared instance (used on the per-request rate limit path)
+settings_service = SettingsService()
@@ -10,6 +10,7 @@ import json
 import queue
 import threading
 import logging
+from collections import deque
 from datetime import datetime
 from typing import Dict, List, Optional, Set
 
@@ -21,12 +22,31 @@ class SystemLogsService:
 
     MAX_LOGS = 300
 
+    # Coalescing window for SSE broadcasts (seconds)
+    SSE_BATCH_WINDOW = 0.02
+
+    # Account numbers mentioned in log messages (e.g. "Account: 12345678")
+    _ACCT_RE = re.compile(r'(?:Acc(?:ount)?[:\s]*|account\s*)(\d{6,12})', re.IGNORECASE)
+
+    # Keywords that mark general system logs as admin-only
+    _SENSITIVE_KEYWORDS = ('login', 'logout', 'cleared', 'unauthorized')
+
     def __init__(self):
         self.logs = []
+        # Account sets aligned index-for-index with self.logs (kept out of the
+        # log entries themselves so they stay JSON serializable)
+        self._log_account_sets: List[frozenset] = []
+        self._last_log_id = 0
         self.logs_lock = threading.Lock()
         self.sse_clients = []
         self.sse_lock = threading.Lock()
 
+        # Log entries waiting to be broadcast; drained by the flusher thread
+        self._pending = deque()
+        self._pending_event = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='SystemLogsSSE', daemon=True)
+        self._flusher.start()
+
     def add_log(self, log_type: str, message: str, user_id: Optional[str] = None, accounts: Optional[List[str]] = None) -> Dict:
         """
         Add a new system log entry
@@ -38,35 +58,48 @@ class SystemLogsService:
             accounts: List of account numbers related to this log (for filtering)
 
         Returns:
-            dict: Created log entry
+            dict: Created log entry. 'id' is an int (time.monotonic_ns()),
+                unique and increasing within this process.
         """
+        # Computed outside the lock to keep the critical section short
+        log_id = time.monotonic_ns()
+        timestamp = datetime.now().isoformat()
+
+        # Try to extract account numbers from message if not provided
+        extracted_accounts = accounts or []
+        if not extracted_accounts:
+            # Extract account numbers from message (common patterns)
+            acc_matches = self._ACCT_RE.findall(message or '')
+            if acc_matches:
+                extracted_accounts = list(set(acc_matches))
+
         with self.logs_lock:
-            # Try to extract account numbers from message if not provided
-            extracted_accounts = accounts or []
-            if not extracted_accounts:
-                # Extract account numbers from message (common patterns)
-                acc_matches = re.findall(r'(?:Acc(?:ount)?[:\s]*|account\s*)(\d{6,12})', message, re.IGNORECASE)
-                if acc_matches:
-                    extracted_accounts = list(set(acc_matches))
-            
+            # Keep ids strictly increasing even on coarse monotonic clocks
+            if log_id <= self._last_log_id:
+                log_id = self._last_log_id + 1
+            self._last_log_id = log_id
+
             log_entry = {
-                'id': time.time() + id(message),
+                'id': log_id,
                 'type': log_type or 'info',
                 'message': message or '',
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': timestamp,
                 'user_id': user_id,
                 'accounts': extracted_accounts
             }
 
             # Add at the beginning (most recent first)
             self.logs.insert(0, log_entry)
+            self._log_account_sets.insert(0, frozenset(str(a) for a in extracted_accounts))
 
             # Limit log size
             if len(self.logs) > self.MAX_LOGS:
                 self.logs.pop()
+                self._log_account_sets.pop()
 
-            # Broadcast to SSE clients
-            self._broadcast_log(log_entry)
+            # Queue for (coalesced) broadcast to SSE clients
+            self._pending.append(log_entry)
+            self._pending_event.set()
 
             return log_entry
 
@@ -90,35 +123,30 @@ class SystemLogsService:
                 return self.logs[:limit]
             
             # Filter logs for specific user
+            user_accounts = frozenset(str(a) for a in (user_accounts or ()))
             filtered_logs = []
-            for log in self.logs:
+            for log, log_accounts in zip(self.logs, self._log_account_sets):
+                if len(filtered_logs) >= limit:
+                    break
+
                 # Include if log belongs to this user
                 if log.get('user_id') == user_id:
                     filtered_logs.append(log)
                     continue
-                
+
                 # Include if log mentions any of user's accounts
-                if user_accounts:
-                    log_accounts = set(log.get('accounts', []))
-                    # Also check message for account numbers
-                    message = log.get('message', '')
-                    for acc in user_accounts:
-                        if acc in log_accounts or acc in message:
-                            filtered_logs.append(log)
-                            break
+                if log_accounts & user_accounts:
+                    filtered_logs.append(log)
                     continue
-                
+
                 # Include general system logs (no user_id and no accounts)
-                if not log.get('user_id') and not log.get('accounts'):
+                if not log.get('user_id') and not log_accounts:
                     # Skip sensitive system logs
                     msg_lower = log.get('message', '').lower()
-                    if any(kw in msg_lower for kw in ['login', 'logout', 'cleared', 'unauthorized']):
+                    if any(kw in msg_lower for kw in self._SENSITIVE_KEYWORDS):
                         continue
                     filtered_logs.append(log)
-                
-                if len(filtered_logs) >= limit:
-                    break
-            
+
             return filtered_logs[:limit]
 
     def get_logs_by_user(self, user_id: str, user_accounts: Set[str], limit: int = 300) -> List[Dict]:
@@ -149,10 +177,17 @@ class SystemLogsService:
             with self.logs_lock:
                 if user_id:
                     # Only clear logs belonging to this user
-                    self.logs = [log for log in self.logs if log.get('user_id') != user_id]
+                    kept = [
+                        (log, acc_set)
+                        for log, acc_set in zip(self.logs, self._log_account_sets)
+                        if log.get('user_id') != user_id
+                    ]
+                    self.logs = [log for log, _ in kept]
+                    self._log_account_sets = [acc_set for _, acc_set in kept]
                 else:
                     # Clear all (admin)
                     self.logs.clear()
+                    self._log_account_sets.clear()
 
             self.add_log('info', 'System logs cleared', user_id=user_id)
             return True
@@ -173,14 +208,38 @@ class SystemLogsService:
             except ValueError:
                 pass
 
-    def _broadcast_log(self, log_entry: Dict):
+    def _flush_loop(self):
+        """Background loop: wait for new logs, then broadcast them in one batch"""
+        while True:
+            self._pending_event.wait()
+            # Let a burst of logs accumulate before serializing
+            time.sleep(self.SSE_BATCH_WINDOW)
+            self._pending_event.clear()
+
+            batch = []
+            while self._pending:
+                batch.append(self._pending.popleft())
+
+            if batch:
+                try:
+                    self._broadcast_logs(batch)
+                except Exception as e:
+                    logger.error(f"[SYSTEM_LOGS] Error broadcasting logs: {e}")
+
+    def _broadcast_logs(self, log_entries: List[Dict]):
         """
-        Broadcast log entry to all SSE clients
+        Broadcast log entries to all SSE clients
+
+        A single entry is sent as-is; a burst is sent as one frame of the
+        form {"logs": [...]} (oldest first).
 
         Args:
-            log_entry: Log entry to broadcast
+            log_entries: Log entries to broadcast
         """
-        data = f"data: {json.dumps(log_entry)}\n\n"
+        if len(log_entries) == 1:
+            data = f"data: {json.dumps(log_entries[0])}\n\n"
+        else:
+            data = f"data: {json.dumps({'logs': log_entries})}\n\n"
 
         with self.sse_lock:
             dead_clients = []
@@ -198,4 +257,3 @@ class SystemLogsService:
                     self.sse_clients.remove(client)
                 except:
                     pass
-
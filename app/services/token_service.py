@@ -11,29 +11,78 @@ Reference: MIGRATION_ROADMAP.md Phase 2.3
 """
 
 import os
+import time
+import queue
+import atexit
 import sqlite3
 import secrets
+import hashlib
 import logging
+import threading
 from datetime import datetime
 from typing import Optional
 
+from app.core.ttl_cache import TTLCache
+from app.services.base_service import BaseService
+
 logger = logging.getLogger(__name__)
 
 # External base URL for webhook endpoints
 EXTERNAL_BASE_URL = os.getenv('EXTERNAL_BASE_URL', 'http://localhost:5000')
+_WEBHOOK_URL_PREFIX = EXTERNAL_BASE_URL.rstrip('/') + '/webhook/'
+
+# Seconds between batched last_used flushes
+LAST_USED_FLUSH_INTERVAL = 2.0
+
+# Attempts before giving up on inserting a new token
+TOKEN_INSERT_ATTEMPTS = 3
+
+# Hot-path statements (kept as constants so pooled connections reuse
+# their prepared statements)
+_SQL_GET_TOKEN_ENTRY = "SELECT user_id, expires_at FROM user_tokens WHERE webhook_token = ?"
+_SQL_UPDATE_LAST_USED = "UPDATE user_tokens SET last_used = ? WHERE webhook_token = ?"
+
+# webhook token (hashed) -> (user_id, expires_at), shared by all TokenService instances
+_token_user_cache = TTLCache(maxsize=10_000, ttl=60)
+
+# Short-lived cache for read endpoints (webhook URL, token info, token list).
+# Keys: ('url', user_id), ('info', token key), ('tokens', user_id)
+_response_cache = TTLCache(maxsize=1024, ttl=30)
 
 
-class TokenService:
+def _now_iso() -> str:
+    """Current local time as ISO-8601, truncated to whole seconds."""
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _token_cache_key(token: str) -> bytes:
+    """Cache key for a token (raw tokens are never kept in memory caches)."""
+    return hashlib.sha256(token.encode()).digest()[:16]
+
+
+class TokenService(BaseService):
     """Service for managing per-user webhook tokens."""
 
     def __init__(self):
-        self.data_dir = os.path.join(os.getcwd(), "data")
-        os.makedirs(self.data_dir, exist_ok=True)
-        self.db_path = os.path.join(self.data_dir, "accounts.db")
-
-    def _get_connection(self) -> sqlite3.Connection:
-        """Get database connection."""
-        return sqlite3.connect(self.db_path)
+        super().__init__()
+
+        # Pending last_used updates, written in batches by a background thread
+        self._last_used_queue = queue.Queue()
+        self._last_used_flusher = None
+        self._last_used_lock = threading.Lock()
+
+        # Schema and indexes are owned by database_init; checked lazily on first use
+        self._has_unique_user_index = None
+
+    def _unique_user_index(self) -> bool:
+        """True if user_tokens.user_id is unique (one token per user)."""
+        if self._has_unique_user_index is None:
+            with self.get_read_conn() as conn:
+                row = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_user_tokens_user_unique'"
+                ).fetchone()
+            self._has_unique_user_index = row is not None
+        return self._has_unique_user_index
 
     def generate_webhook_token(self, user_id: str) -> str:
         """
@@ -47,48 +96,33 @@ class TokenService:
         Returns:
             str: Generated webhook token
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Check if user already has a token
-            cursor.execute(
-                "SELECT webhook_token FROM user_tokens WHERE user_id = ?",
-                (user_id,)
-            )
-            existing = cursor.fetchone()
-
-            if existing:
-                return existing[0]
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
 
-            # Generate new unique token
-            while True:
-                token = f"whk_{secrets.token_urlsafe(32)}"
+            try:
+                # Check if user already has a token
                 cursor.execute(
-                    "SELECT 1 FROM user_tokens WHERE webhook_token = ?",
-                    (token,)
+                    "SELECT webhook_token FROM user_tokens WHERE user_id = ?",
+                    (user_id,)
                 )
-                if not cursor.fetchone():
-                    break
+                existing = cursor.fetchone()
 
-            # Create token record
-            # Note: token_id is INTEGER AUTOINCREMENT, so we don't insert it
-            now = datetime.now().isoformat()
+                if existing:
+                    return existing[0]
 
-            cursor.execute("""
-                INSERT INTO user_tokens (user_id, webhook_token, created_at)
-                VALUES (?, ?, ?)
-            """, (user_id, token, now))
-            conn.commit()
+                # Create token record (uniqueness enforced by the DB constraint)
+                token = self._insert_new_token(cursor, user_id)
+                conn.commit()
+                _response_cache.pop(('url', user_id))
+                _response_cache.pop(('tokens', user_id))
 
-            logger.info(f"[TOKEN_SERVICE] Generated webhook token for user: {user_id}")
-            return token
+                logger.info(f"[TOKEN_SERVICE] Generated webhook token for user: {user_id}")
+                return token
 
-        except sqlite3.Error as e:
-            logger.error(f"[TOKEN_SERVICE] Error generating token: {e}")
-            raise
-        finally:
-            conn.close()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"[TOKEN_SERVICE] Error generating token: {e}")
+                raise
 
     def get_user_by_webhook_token(self, token: str) -> Optional[str]:
         """
@@ -102,19 +136,34 @@ class TokenService:
         Returns:
             str: User ID or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        entry = self._lookup_token(token)
+        return entry[0] if entry else None
 
-        try:
-            cursor.execute(
-                "SELECT user_id FROM user_tokens WHERE webhook_token = ?",
-                (token,)
-            )
-            row = cursor.fetchone()
-            return row[0] if row else None
+    def _lookup_token(self, token: str) -> Optional[tuple]:
+        """
+        Resolve a token to (user_id, expires_at) through the TTL cache.
+
+        Args:
+            token: Webhook token
+
+        Returns:
+            tuple: (user_id, expires_at) or None if the token doesn't exist
+        """
+        key = _token_cache_key(token)
+        entry = _token_user_cache.get(key)
+        if entry is not None:
+            return entry
+
+        with self.get_read_conn() as conn:
+            row = conn.execute(_SQL_GET_TOKEN_ENTRY, (token,)).fetchone()
 
-        finally:
-            conn.close()
+        # Unknown tokens are not cached so invalid tokens can't fill the cache
+        if not row:
+            return None
+
+        entry = (row[0], row[1])
+        _token_user_cache.set(key, entry)
+        return entry
 
     def get_user_webhook_token(self, user_id: str) -> Optional[str]:
         """
@@ -126,10 +175,9 @@ class TokenService:
         Returns:
             str: Webhook token or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self.get_read_conn() as conn:
+            cursor = conn.cursor()
 
-        try:
             cursor.execute(
                 "SELECT webhook_token FROM user_tokens WHERE user_id = ?",
                 (user_id,)
@@ -137,9 +185,6 @@ class TokenService:
             row = cursor.fetchone()
             return row[0] if row else None
 
-        finally:
-            conn.close()
-
     def rotate_token(self, user_id: str) -> str:
         """
         Generate new token, invalidate old.
@@ -152,24 +197,61 @@ class TokenService:
         Returns:
             str: New webhook token
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
 
-        try:
-            # Delete existing token
-            cursor.execute(
-                "DELETE FROM user_tokens WHERE user_id = ?",
-                (user_id,)
-            )
-            conn.commit()
+            try:
+                # Delete the old token and insert the new one in one transaction
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(
+                    "DELETE FROM user_tokens WHERE user_id = ?",
+                    (user_id,)
+                )
+                token = self._insert_new_token(cursor, user_id)
+                conn.commit()
+                # Old token is unknown here; drop all cached lookups
+                _token_user_cache.clear()
+                _response_cache.clear()
 
-            logger.info(f"[TOKEN_SERVICE] Rotated token for user: {user_id}")
+                logger.info(f"[TOKEN_SERVICE] Rotated token for user: {user_id}")
+                return token
 
-        finally:
-            conn.close()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"[TOKEN_SERVICE] Error rotating token: {e}")
+                raise
 
-        # Generate new token
-        return self.generate_webhook_token(user_id)
+    def _insert_new_token(self, cursor: sqlite3.Cursor, user_id: str) -> str:
+        """
+        Insert a freshly generated token for user (caller commits).
+
+        Relies on the UNIQUE constraint on webhook_token instead of probing
+        for collisions first; a collision just triggers another attempt.
+
+        Args:
+            cursor: Cursor inside the caller's transaction
+            user_id: User ID to generate token for
+
+        Returns:
+            str: Inserted webhook token
+        """
+        # Note: token_id is INTEGER AUTOINCREMENT, so we don't insert it
+        now = datetime.now().isoformat()
+
+        # A real collision is ~2^-256; repeated IntegrityErrors mean some
+        # other constraint failed, so give up instead of looping forever
+        for attempt in range(TOKEN_INSERT_ATTEMPTS):
+            token = f"whk_{secrets.token_urlsafe(32)}"
+            try:
+                cursor.execute("""
+                    INSERT INTO user_tokens (user_id, webhook_token, created_at)
+                    VALUES (?, ?, ?)
+                """, (user_id, token, now))
+                return token
+            except sqlite3.IntegrityError:
+                if attempt == TOKEN_INSERT_ATTEMPTS - 1:
+                    raise
+                logger.warning("[TOKEN_SERVICE] Webhook token collision, regenerating")
 
     def revoke_token(self, token: str) -> bool:
         """
@@ -183,25 +265,26 @@ class TokenService:
         Returns:
             bool: True if revoked
         """
-        conn = self._get_connection()
-
-        try:
-            cursor = conn.execute(
-                "DELETE FROM user_tokens WHERE webhook_token = ?",
-                (token,)
-            )
-            conn.commit()
+        with self.get_conn() as conn:
+            try:
+                cursor = conn.execute(
+                    "DELETE FROM user_tokens WHERE webhook_token = ?",
+                    (token,)
+                )
+                conn.commit()
+                _token_user_cache.pop(_token_cache_key(token))
+                # Owner is unknown here; drop all cached responses
+                _response_cache.clear()
 
-            if cursor.rowcount > 0:
-                logger.info(f"[TOKEN_SERVICE] Revoked token: {token[:20]}...")
-                return True
-            return False
+                if cursor.rowcount > 0:
+                    logger.info(f"[TOKEN_SERVICE] Revoked token: {token[:20]}...")
+                    return True
+                return False
 
-        except sqlite3.Error as e:
-            logger.error(f"[TOKEN_SERVICE] Error revoking token: {e}")
-            return False
-        finally:
-            conn.close()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"[TOKEN_SERVICE] Error revoking token: {e}")
+                return False
 
     def get_webhook_url(self, user_id: str) -> Optional[str]:
         """
@@ -215,14 +298,33 @@ class TokenService:
         Returns:
             str: Full webhook URL (e.g., https://domain.com/webhook/whk_xxx)
         """
-        token = self.get_user_webhook_token(user_id)
-
-        if not token:
-            # Auto-generate token if user doesn't have one
-            token = self.generate_webhook_token(user_id)
+        url = _response_cache.get(('url', user_id))
+        if url is not None:
+            return url
+
+        if self._unique_user_index():
+            # Insert a new token or return the existing one in one statement
+            with self.get_conn() as conn:
+                row = conn.execute("""
+                    INSERT INTO user_tokens (user_id, webhook_token, created_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET user_id = user_id
+                    RETURNING webhook_token
+                """, (user_id, f"whk_{secrets.token_urlsafe(32)}", datetime.now().isoformat())).fetchone()
+            token = row[0] if row else None
+        else:
+            token = self.get_user_webhook_token(user_id)
+
+            if not token:
+                # Auto-generate token if user doesn't have one
+                token = self.generate_webhook_token(user_id)
 
         if token:
-            return f"{EXTERNAL_BASE_URL}/webhook/{token}"
+            url = _WEBHOOK_URL_PREFIX + token
+            _response_cache.set(('url', user_id), url)
+            # A token may have just been created for this user
+            _response_cache.pop(('tokens', user_id))
+            return url
 
         return None
 
@@ -236,45 +338,85 @@ class TokenService:
         Returns:
             str: Full webhook URL
         """
-        return f"{EXTERNAL_BASE_URL}/webhook/{token}"
+        return _WEBHOOK_URL_PREFIX + token
 
     def update_last_used(self, token: str) -> bool:
         """
         Update last_used timestamp for a token.
 
-        Called when webhook is triggered.
+        Called when webhook is triggered. The write is queued and applied
+        in a batch by a background thread (see flush_last_used).
 
         Args:
             token: Webhook token
 
         Returns:
-            bool: True if updated
+            bool: True if queued
         """
-        conn = self._get_connection()
+        self._start_last_used_flusher()
+        self._last_used_queue.put((token, time.time()))
+        return True
+
+    def _start_last_used_flusher(self):
+        """Start the background last_used writer on first use."""
+        if self._last_used_flusher is not None:
+            return
+
+        with self._last_used_lock:
+            if self._last_used_flusher is None:
+                self._last_used_flusher = threading.Thread(
+                    target=self._last_used_loop,
+                    name='TokenLastUsedFlusher',
+                    daemon=True
+                )
+                self._last_used_flusher.start()
+                atexit.register(self.flush_last_used)
 
-        try:
-            # Check if last_used column exists
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(user_tokens)")
-            columns = [col[1] for col in cursor.fetchall()]
+    def _last_used_loop(self):
+        """Background loop: flush queued last_used updates periodically."""
+        while True:
+            time.sleep(LAST_USED_FLUSH_INTERVAL)
+            self.flush_last_used()
 
-            if 'last_used' not in columns:
-                # Add column if it doesn't exist
-                cursor.execute("ALTER TABLE user_tokens ADD COLUMN last_used TEXT")
-                conn.commit()
+    def flush_last_used(self) -> int:
+        """
+        Write all queued last_used updates in one transaction.
 
-            cursor.execute(
-                "UPDATE user_tokens SET last_used = ? WHERE webhook_token = ?",
-                (datetime.now().isoformat(), token)
-            )
-            conn.commit()
-            return cursor.rowcount > 0
+        Duplicate tokens are coalesced, keeping the latest timestamp.
+        Timestamps are queued as epoch seconds and formatted to ISO here,
+        off the request path.
 
-        except sqlite3.Error as e:
-            logger.error(f"[TOKEN_SERVICE] Error updating last_used: {e}")
-            return False
-        finally:
-            conn.close()
+        Returns:
+            int: Number of tokens updated
+        """
+        latest = {}
+        while True:
+            try:
+                token, used_at = self._last_used_queue.get_nowait()
+            except queue.Empty:
+                break
+            latest[token] = used_at
+
+        if not latest:
+            return 0
+
+        with self.get_conn() as conn:
+            try:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    _SQL_UPDATE_LAST_USED,
+                    [
+                        (datetime.fromtimestamp(used_at).isoformat(), token)
+                        for token, used_at in latest.items()
+                    ]
+                )
+                conn.commit()
+                return len(latest)
+
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"[TOKEN_SERVICE] Error updating last_used: {e}")
+                return 0
 
     def get_token_info(self, token: str) -> Optional[dict]:
         """
@@ -286,69 +428,87 @@ class TokenService:
         Returns:
             dict: Token info or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        key = ('info', _token_cache_key(token))
+        info = _response_cache.get(key)
+        if info is not None:
+            return dict(info)
+
+        with self.get_read_conn() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
 
-        try:
             cursor.execute(
                 """
-                SELECT token_id, user_id, webhook_token, webhook_url, created_at
+                SELECT token_id, user_id, webhook_url, created_at
                 FROM user_tokens WHERE webhook_token = ?
                 """,
                 (token,)
             )
             row = cursor.fetchone()
 
-            if row:
-                return {
-                    'token_id': row[0],
-                    'user_id': row[1],
-                    'webhook_token': row[2],
-                    'webhook_url': row[3],
-                    'created_at': row[4]
-                }
+        if not row:
             return None
 
-        finally:
-            conn.close()
-
-    def get_all_tokens_for_user(self, user_id: str) -> list:
+        info = {
+            'token_id': row['token_id'],
+            'user_id': row['user_id'],
+            'webhook_token': token,
+            'webhook_url': row['webhook_url'],
+            'created_at': row['created_at']
+        }
+        _response_cache.set(key, info)
+        return dict(info)
+
+    def get_all_tokens_for_user(self, user_id: str, limit: Optional[int] = None, offset: int = 0) -> list:
         """
         Get all tokens for a user.
 
         Args:
             user_id: User ID
+            limit: Maximum number of tokens to return (None = all)
+            offset: Number of tokens to skip
 
         Returns:
             list: List of token dictionaries
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        # Only the unpaginated list is cached
+        cacheable = limit is None and offset == 0
+        if cacheable:
+            tokens = _response_cache.get(('tokens', user_id))
+            if tokens is not None:
+                return [dict(info) for info in tokens]
+
+        with self.get_read_conn() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
 
-        try:
             cursor.execute(
                 """
-                SELECT token_id, user_id, webhook_token, webhook_url, created_at
+                SELECT token_id, user_id, webhook_token, created_at
                 FROM user_tokens WHERE user_id = ?
                 ORDER BY created_at DESC
+                LIMIT ? OFFSET ?
                 """,
-                (user_id,)
+                (user_id, -1 if limit is None else limit, offset)
             )
             rows = cursor.fetchall()
 
-            return [
-                {
-                    'token_id': row[0],
-                    'user_id': row[1],
-                    'webhook_token': row[2],
-                    'webhook_url': row[3] or f"{EXTERNAL_BASE_URL}/webhook/{row[2]}",
-                    'created_at': row[4]
-                }
-                for row in rows
-            ]
-
-        finally:
-            conn.close()
+        # webhook_url is never stored, so build it from the token
+        tokens = [
+            {
+                'token_id': row['token_id'],
+                'user_id': row['user_id'],
+                'webhook_token': row['webhook_token'],
+                'webhook_url': _WEBHOOK_URL_PREFIX + row['webhook_token'],
+                'created_at': row['created_at']
+            }
+            for row in rows
+        ]
+
+        if cacheable:
+            _response_cache.set(('tokens', user_id), tokens)
+            return [dict(info) for info in tokens]
+        return tokens
 
     # Note: get_webhook_url is defined earlier in this class
 
@@ -362,32 +522,14 @@ class TokenService:
         Returns:
             bool: True if valid
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                SELECT user_id, expires_at 
-                FROM user_tokens 
-                WHERE webhook_token = ?
-            """, (token,))
-
-            row = cursor.fetchone()
-            if not row:
-                return False
-
-            # Check expiration if set
-            expires_at = row[1]
-            if expires_at:
-                try:
-                    expiry = datetime.fromisoformat(expires_at)
-                    if datetime.now() > expiry:
-                        return False
-                except:
-                    pass
+        entry = self._lookup_token(token)
+        if entry is None:
+            return False
 
-            return True
+        # ISO-8601 strings sort chronologically
+        expires_at = entry[1]
+        return not expires_at or expires_at > _now_iso()
 
-        finally:
-            conn.close()
 
+# Shared instance (pool, last_used flusher and caches are set up once per process)
+token_service = TokenService()
@@ -13,80 +13,159 @@ Updated: Domain + License Key unified endpoint system
 """
 
 import os
+import re
+import time
+import queue
+import base64
+import atexit
 import sqlite3
 import secrets
+import hashlib
 import logging
+import threading
 from datetime import datetime
 from typing import Optional, List
 
+from app.core.ttl_cache import TTLCache
+from app.services.base_service import BaseService
+
 logger = logging.getLogger(__name__)
 
+# Stored in PRAGMA user_version once _ensure_columns has migrated the users table
+USERS_SCHEMA_VERSION = 2
+
+# Seconds between batched last_login flushes
+LAST_LOGIN_FLUSH_INTERVAL = 5.0
+
+# Seconds before cached user counts are reloaded from SQLite
+USER_COUNT_TTL = 300.0
+
+# license key (hashed) -> (user dict, webhook_secret) for active users.
+# Cleared on every user write except last_login (writes are rare next to
+# webhook lookups).
+_license_key_cache = TTLCache(maxsize=10_000, ttl=60)
+
+
+# Cheap structural check so malformed keys never reach the cache or SQLite.
+# Generated keys are whk_ + 24 URL-safe chars; the range also admits
+# older/hand-made keys.
+_is_license_key_format = re.compile(r'whk_[A-Za-z0-9_-]{6,60}').fullmatch
+
+
+def _license_cache_key(license_key: str) -> bytes:
+    """Cache key for a license key (raw keys are never kept in memory caches)."""
+    return hashlib.sha256(license_key.encode()).digest()[:16]
+
+
+# Columns returned by every user lookup (see _row_to_user)
+_USER_COLUMNS = "user_id, email, name, picture, created_at, last_login, is_active, is_admin"
+
+
+def _row_to_user(row: sqlite3.Row) -> dict:
+    """Build a user dict from a sqlite3.Row of _USER_COLUMNS."""
+    user = dict(row)
+    user['is_active'] = bool(user['is_active'])
+    user['is_admin'] = bool(user['is_admin'])
+    return user
+
 
-class UserService:
+class UserService(BaseService):
     """Service for managing users in multi-tenant system."""
+
+    # Statements used on login/webhook paths, built once so every call
+    # reuses the same string (and the connection's prepared statement)
+    _Q_GET_BY_EMAIL = f"SELECT {_USER_COLUMNS} FROM users WHERE email = ? COLLATE NOCASE"
+    _Q_GET_BY_ID = f"SELECT {_USER_COLUMNS} FROM users WHERE user_id = ?"
+    _Q_GET_BY_LICENSE_KEY = (
+        f"SELECT {_USER_COLUMNS}, webhook_secret FROM users "
+        "WHERE license_key = ? AND is_active = 1"
+    )
+    _Q_LIST_USERS = f"SELECT {_USER_COLUMNS} FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?"
+    _Q_FIRST_ADMIN = (
+        f"SELECT {_USER_COLUMNS} FROM users "
+        "WHERE is_admin = 1 AND is_active = 1 ORDER BY created_at ASC LIMIT 1"
+    )
+    _Q_UPSERT_USER = """
+        INSERT INTO users (user_id, email, name, picture, created_at, last_login, is_active, is_admin, license_key, webhook_secret)
+        VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, NULL)
+        ON CONFLICT(email) DO UPDATE SET
+            name = excluded.name,
+            picture = excluded.picture,
+            last_login = excluded.last_login
+        RETURNING user_id, email, name, picture, is_active, is_admin
+    """
+    _Q_ACCOUNTS_LIST = "SELECT account FROM accounts WHERE user_id = ?"
+    _Q_CREDENTIALS = "SELECT license_key, webhook_secret FROM users WHERE user_id = ?"
     
     def __init__(self):
-        self.data_dir = os.path.join(os.getcwd(), "data")
-        os.makedirs(self.data_dir, exist_ok=True)
-        self.db_path = os.path.join(self.data_dir, "accounts.db")
-        self._ensure_columns()
+        super().__init__()
+
+        # Pending last_login updates, written in batches by a background thread
+        self._last_login_queue = queue.Queue()
+        self._last_login_flusher = None
+        self._last_login_lock = threading.Lock()
+
+        # Cached (total, active) user counts
+        self._user_counts = None
+        self._user_counts_at = 0.0
+        self._user_counts_lock = threading.Lock()
 
-    def _get_connection(self) -> sqlite3.Connection:
-        """Get database connection."""
-        return sqlite3.connect(self.db_path)
+        self._ensure_columns()
     
     def _ensure_columns(self):
         """Ensure license_key and webhook_secret columns exist in users table."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-
-            # Check if users table exists first
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-            if not cursor.fetchone():
-                # Table doesn't exist yet - will be created by database_init
-                conn.close()
-                return
-
-            # Check existing columns
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [col[1] for col in cursor.fetchall()]
-
-            # Add license_key column if missing
-            # Note: SQLite cannot add UNIQUE column to table with existing data
-            # So we add without UNIQUE constraint, uniqueness enforced at insert time
-            if 'license_key' not in columns:
-                try:
-                    cursor.execute('ALTER TABLE users ADD COLUMN license_key TEXT')
-                    conn.commit()
-                    logger.info("[USER_SERVICE] Added 'license_key' column to users table")
-                except sqlite3.OperationalError as e:
-                    if 'duplicate column name' not in str(e).lower():
-                        logger.warning(f"[USER_SERVICE] Could not add license_key column: {e}")
-
-            # Add webhook_secret column if missing
-            if 'webhook_secret' not in columns:
-                try:
-                    cursor.execute('ALTER TABLE users ADD COLUMN webhook_secret TEXT')
+            with self.get_conn() as conn:
+                cursor = conn.cursor()
+
+                # Already migrated by an earlier start
+                cursor.execute("PRAGMA user_version")
+                if cursor.fetchone()[0] >= USERS_SCHEMA_VERSION:
+                    return
+
+                # Check if users table exists first
+                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
+                if not cursor.fetchone():
+                    # Table doesn't exist yet - will be created by database_init
+                    return
+
+                # Check existing columns
+                cursor.execute("PRAGMA table_info(users)")
+                columns = [col[1] for col in cursor.fetchall()]
+
+                # Add license_key column if missing
+                # Note: SQLite cannot add UNIQUE column to table with existing data
+                # So we add without UNIQUE constraint, uniqueness enforced at insert time
+                if 'license_key' not in columns:
+                    try:
+                        cursor.execute('ALTER TABLE users ADD COLUMN license_key TEXT')
+                        conn.commit()
+                        logger.info("[USER_SERVICE] Added 'license_key' column to users table")
+                    except sqlite3.OperationalError as e:
+                        if 'duplicate column name' not in str(e).lower():
+                            logger.warning(f"[USER_SERVICE] Could not add license_key column: {e}")
+
+                # Add webhook_secret column if missing
+                if 'webhook_secret' not in columns:
+                    try:
+                        cursor.execute('ALTER TABLE users ADD COLUMN webhook_secret TEXT')
+                        conn.commit()
+                        logger.info("[USER_SERVICE] Added 'webhook_secret' column to users table")
+                    except sqlite3.OperationalError as e:
+                        if 'duplicate column name' not in str(e).lower():
+                            logger.warning(f"[USER_SERVICE] Could not add webhook_secret column: {e}")
+
+                # Generate license keys for existing users (webhook_secret is optional - NOT auto-generated)
+                # Users can choose to have no secret (clear_webhook_secret), so we don't force-generate it
+                cursor.execute("SELECT user_id FROM users WHERE license_key IS NULL")
+                updates = [(self.generate_license_key(), user_id) for (user_id,) in cursor]
+                if updates:
+                    cursor.execute("BEGIN")
+                    cursor.executemany("UPDATE users SET license_key = ? WHERE user_id = ?", updates)
                     conn.commit()
-                    logger.info("[USER_SERVICE] Added 'webhook_secret' column to users table")
-                except sqlite3.OperationalError as e:
-                    if 'duplicate column name' not in str(e).lower():
-                        logger.warning(f"[USER_SERVICE] Could not add webhook_secret column: {e}")
-
-            # Generate license keys for existing users (webhook_secret is optional - NOT auto-generated)
-            # Users can choose to have no secret (clear_webhook_secret), so we don't force-generate it
-            cursor.execute("SELECT user_id FROM users WHERE license_key IS NULL")
-            users = cursor.fetchall()
-            for (user_id,) in users:
-                new_license_key = self.generate_license_key()
-                cursor.execute("UPDATE users SET license_key = ? WHERE user_id = ?", (new_license_key, user_id))
-
-            conn.commit()
-            if users:
-                logger.info(f"[USER_SERVICE] Generated license keys for {len(users)} existing users")
-
-            conn.close()
+                    logger.info(f"[USER_SERVICE] Generated license keys for {len(updates)} existing users")
+
+                cursor.execute(f"PRAGMA user_version = {USERS_SCHEMA_VERSION}")
         except Exception as e:
             logger.error(f"[USER_SERVICE] Error ensuring columns: {e}")
 
@@ -101,7 +180,8 @@ class UserService:
             str: Unique license key
         """
         prefix = "whk_"
-        random_part = secrets.token_urlsafe(18)[:24]
+        # 18 bytes encode to exactly 24 base64 characters (no padding)
+        random_part = base64.urlsafe_b64encode(secrets.token_bytes(18)).decode('ascii')
         return f"{prefix}{random_part}"
 
     def generate_webhook_secret(self) -> str:
@@ -115,7 +195,8 @@ class UserService:
             str: Unique webhook secret
         """
         prefix = "whs_"
-        random_part = secrets.token_urlsafe(24)[:32]
+        # 24 bytes encode to exactly 32 base64 characters (no padding)
+        random_part = base64.urlsafe_b64encode(secrets.token_bytes(24)).decode('ascii')
         return f"{prefix}{random_part}"
 
     def generate_user_id(self, email: str) -> str:
@@ -144,63 +225,48 @@ class UserService:
         if not email:
             raise ValueError("Email is required")
         
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # Check if user exists
-            cursor.execute(
-                "SELECT user_id, email, name, picture, is_active, is_admin FROM users WHERE email = ?",
-                (email,)
-            )
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Update existing user
-                user_id = existing[0]
-                cursor.execute("""
-                    UPDATE users 
-                    SET name = ?, picture = ?, last_login = ?
-                    WHERE user_id = ?
-                """, (name, picture, datetime.now().isoformat(), user_id))
-                conn.commit()
-                
-                logger.info(f"[USER_SERVICE] Updated existing user: {email}")
-                
-                return {
-                    'user_id': existing[0],
-                    'email': existing[1],
-                    'name': name or existing[2],
-                    'picture': picture or existing[3],
-                    'is_active': bool(existing[4]),
-                    'is_admin': bool(existing[5]),
-                    'is_new': False
-                }
-            else:
-                # Create new user
-                user_id = self.generate_user_id(email)
-                now = datetime.now().isoformat()
-                
-                # Check if this is the admin email
-                admin_email = os.getenv('ADMIN_EMAIL', '').lower()
-                is_admin = 1 if email == admin_email else 0
-                
-                # Generate unique license key only (webhook_secret is NOT auto-generated)
-                # User must explicitly generate/set their own secret via API
-                license_key = self.generate_license_key()
-
-                cursor.execute("""
-                    INSERT INTO users (user_id, email, name, picture, created_at, last_login, is_active, is_admin, license_key, webhook_secret)
-                    VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, NULL)
-                """, (user_id, email, name, picture, now, now, is_admin, license_key))
-                conn.commit()
-                
+        # Values used only if this turns out to be a new user
+        new_user_id = self.generate_user_id(email)
+        now = datetime.now().isoformat()
+
+        # Check if this is the admin email
+        admin_email = os.getenv('ADMIN_EMAIL', '').lower()
+        is_admin = 1 if email == admin_email else 0
+
+        # Generate unique license key only (webhook_secret is NOT auto-generated)
+        # User must explicitly generate/set their own secret via API
+        license_key = self.generate_license_key()
+
+        with self.get_conn() as conn:
+            try:
+                # Insert, or refresh profile/last_login if the email exists (one atomic statement)
+                row = conn.execute(
+                    self._Q_UPSERT_USER,
+                    (new_user_id, email, name, picture, now, now, is_admin, license_key)
+                ).fetchone()
+                _license_key_cache.clear()
+
+                if row[0] != new_user_id:
+                    logger.info(f"[USER_SERVICE] Updated existing user: {email}")
+
+                    return {
+                        'user_id': row[0],
+                        'email': row[1],
+                        'name': row[2],
+                        'picture': row[3],
+                        'is_active': bool(row[4]),
+                        'is_admin': bool(row[5]),
+                        'is_new': False
+                    }
+
+                self._adjust_user_counts(total=1, active=1)
+
                 logger.info(f"[USER_SERVICE] Created new user: {email} (admin: {is_admin})")
                 logger.info(f"[USER_SERVICE] 🔑 License Key for {email}: {license_key}")
                 logger.info(f"[USER_SERVICE] 🔓 No webhook secret - user can generate via API if needed")
 
                 return {
-                    'user_id': user_id,
+                    'user_id': new_user_id,
                     'email': email,
                     'name': name,
                     'picture': picture,
@@ -210,12 +276,71 @@ class UserService:
                     'license_key': license_key,
                     'webhook_secret': None  # User must generate themselves
                 }
-                
-        except sqlite3.Error as e:
-            logger.error(f"[USER_SERVICE] Database error: {e}")
-            raise
-        finally:
-            conn.close()
+
+            except sqlite3.Error as e:
+                logger.error(f"[USER_SERVICE] Database error: {e}")
+                raise
+    
+    def bulk_create_users(self, google_data_list: List[dict]) -> int:
+        """
+        Create or update many users in one transaction (admin import).
+
+        Same semantics as create_or_update_user for each entry, but all
+        rows are written with a single executemany. Entries without an
+        email are skipped.
+
+        Args:
+            google_data_list: List of dicts with email, name, picture
+
+        Returns:
+            int: Number of users created or updated
+        """
+        now = datetime.now().isoformat()
+        admin_email = os.getenv('ADMIN_EMAIL', '').lower()
+
+        rows = []
+        for google_data in google_data_list:
+            email = google_data.get('email', '').lower()
+            if not email:
+                continue
+            rows.append((
+                self.generate_user_id(email),
+                email,
+                google_data.get('name', ''),
+                google_data.get('picture', ''),
+                now,
+                now,
+                1 if email == admin_email else 0,
+                self.generate_license_key()
+            ))
+
+        if not rows:
+            return 0
+
+        with self.get_conn() as conn:
+            try:
+                conn.execute("BEGIN")
+                conn.executemany("""
+                    INSERT INTO users (user_id, email, name, picture, created_at, last_login, is_active, is_admin, license_key, webhook_secret)
+                    VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, NULL)
+                    ON CONFLICT(email) DO UPDATE SET
+                        name = excluded.name,
+                        picture = excluded.picture,
+                        last_login = excluded.last_login
+                """, rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"[USER_SERVICE] Bulk user import failed: {e}")
+                raise
+
+        _license_key_cache.clear()
+        # New vs updated isn't known here; reload counts on next read
+        with self._user_counts_lock:
+            self._user_counts = None
+
+        logger.info(f"[USER_SERVICE] Bulk imported {len(rows)} users")
+        return len(rows)
     
     def get_user_by_email(self, email: str) -> Optional[dict]:
         """
@@ -229,32 +354,14 @@ class UserService:
         Returns:
             dict: User data or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("""
-                SELECT user_id, email, name, picture, created_at, last_login, is_active, is_admin
-                FROM users 
-                WHERE email = ?
-            """, (email.lower(),))
-            
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(self._Q_GET_BY_EMAIL, (email,))
+            cursor.row_factory = sqlite3.Row
+
             row = cursor.fetchone()
             if row:
-                return {
-                    'user_id': row[0],
-                    'email': row[1],
-                    'name': row[2],
-                    'picture': row[3],
-                    'created_at': row[4],
-                    'last_login': row[5],
-                    'is_active': bool(row[6]),
-                    'is_admin': bool(row[7])
-                }
+                return _row_to_user(row)
             return None
-            
-        finally:
-            conn.close()
     
     def get_user_by_id(self, user_id: str) -> Optional[dict]:
         """
@@ -266,59 +373,93 @@ class UserService:
         Returns:
             dict: User data or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("""
-                SELECT user_id, email, name, picture, created_at, last_login, is_active, is_admin
-                FROM users 
-                WHERE user_id = ?
-            """, (user_id,))
-            
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(self._Q_GET_BY_ID, (user_id,))
+            cursor.row_factory = sqlite3.Row
+
             row = cursor.fetchone()
             if row:
-                return {
-                    'user_id': row[0],
-                    'email': row[1],
-                    'name': row[2],
-                    'picture': row[3],
-                    'created_at': row[4],
-                    'last_login': row[5],
-                    'is_active': bool(row[6]),
-                    'is_admin': bool(row[7])
-                }
+                return _row_to_user(row)
             return None
-            
-        finally:
-            conn.close()
     
     def update_last_login(self, user_id: str) -> bool:
         """
         Update last login timestamp.
         
         Per MIGRATION_ROADMAP.md Phase 2.2
+
+        The write is queued and applied in a batch by a background thread
+        (see flush_last_login).
         
         Args:
             user_id: User ID
             
         Returns:
-            bool: True if updated
+            bool: True if queued
         """
-        conn = self._get_connection()
-        
-        try:
-            conn.execute(
-                "UPDATE users SET last_login = ? WHERE user_id = ?",
-                (datetime.now().isoformat(), user_id)
-            )
-            conn.commit()
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"[USER_SERVICE] Error updating last_login: {e}")
-            return False
-        finally:
-            conn.close()
+        self._start_last_login_flusher()
+        self._last_login_queue.put((user_id, time.time()))
+        return True
+
+    def _start_last_login_flusher(self):
+        """Start the background last_login writer on first use."""
+        if self._last_login_flusher is not None:
+            return
+
+        with self._last_login_lock:
+            if self._last_login_flusher is None:
+                self._last_login_flusher = threading.Thread(
+                    target=self._last_login_loop,
+                    name='UserLastLoginFlusher',
+                    daemon=True
+                )
+                self._last_login_flusher.start()
+                atexit.register(self.flush_last_login)
+
+    def _last_login_loop(self):
+        """Background loop: flush queued last_login updates periodically."""
+        while True:
+            time.sleep(LAST_LOGIN_FLUSH_INTERVAL)
+            self.flush_last_login()
+
+    def flush_last_login(self) -> int:
+        """
+        Write all queued last_login updates in one transaction.
+
+        Duplicate users are coalesced, keeping the latest timestamp.
+        Cached license key lookups are left alone; their last_login may
+        lag by up to the cache TTL.
+
+        Returns:
+            int: Number of users updated
+        """
+        latest = {}
+        while True:
+            try:
+                user_id, login_at = self._last_login_queue.get_nowait()
+            except queue.Empty:
+                break
+            latest[user_id] = login_at
+
+        if not latest:
+            return 0
+
+        with self.get_conn() as conn:
+            try:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "UPDATE users SET last_login = ? WHERE user_id = ?",
+                    [
+                        (datetime.fromtimestamp(login_at).isoformat(), user_id)
+                        for user_id, login_at in latest.items()
+                    ]
+                )
+                conn.commit()
+                return len(latest)
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"[USER_SERVICE] Error updating last_login: {e}")
+                return 0
     
     def toggle_user_status(self, user_id: str) -> bool:
         """
@@ -332,22 +473,22 @@ class UserService:
         Returns:
             bool: True if toggled
         """
-        conn = self._get_connection()
-        
-        try:
-            conn.execute("""
-                UPDATE users 
-                SET is_active = CASE WHEN is_active = 1 THEN 0 ELSE 1 END
-                WHERE user_id = ?
-            """, (user_id,))
-            conn.commit()
-            logger.info(f"[USER_SERVICE] Toggled user status: {user_id}")
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"[USER_SERVICE] Error toggling user: {e}")
-            return False
-        finally:
-            conn.close()
+        with self.get_conn() as conn:
+            try:
+                row = conn.execute("""
+                    UPDATE users 
+                    SET is_active = CASE WHEN is_active = 1 THEN 0 ELSE 1 END
+                    WHERE user_id = ?
+                    RETURNING is_active
+                """, (user_id,)).fetchone()
+                _license_key_cache.clear()
+                if row:
+                    self._adjust_user_counts(active=1 if row[0] == 1 else -1)
+                logger.info(f"[USER_SERVICE] Toggled user status: {user_id}")
+                return True
+            except sqlite3.Error as e:
+                logger.error(f"[USER_SERVICE] Error toggling user: {e}")
+                return False
     
     def get_user_stats(self, user_id: str) -> dict:
         """
@@ -361,94 +502,84 @@ class UserService:
         Returns:
             dict: Statistics
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # Count accounts
-            cursor.execute(
-                "SELECT COUNT(*) FROM accounts WHERE user_id = ?",
-                (user_id,)
-            )
-            accounts_count = cursor.fetchone()[0]
-            
-            # Count pairs (from JSON, approximate)
-            pairs_count = 0
+        with self.get_read_conn() as conn:
             try:
-                import json
-                pairs_file = os.path.join(self.data_dir, "copy_pairs.json")
-                if os.path.exists(pairs_file):
-                    with open(pairs_file, 'r', encoding='utf-8') as f:
-                        pairs = json.load(f)
-                    pairs_count = len([p for p in pairs if p.get('user_id') == user_id])
-            except:
-                pass
-            
+                # Both counts in one statement (copy_pairs mirrors copy_pairs.json)
+                accounts_count, pairs_count = conn.execute("""
+                    SELECT
+                        (SELECT COUNT(*) FROM accounts WHERE user_id = ?),
+                        (SELECT COUNT(*) FROM copy_pairs WHERE user_id = ?)
+                """, (user_id, user_id)).fetchone()
+            except sqlite3.OperationalError:
+                # copy_pairs table not created yet
+                accounts_count = conn.execute(
+                    "SELECT COUNT(*) FROM accounts WHERE user_id = ?",
+                    (user_id,)
+                ).fetchone()[0]
+                pairs_count = 0
+
             return {
                 'accounts_count': accounts_count,
                 'pairs_count': pairs_count,
                 'trades_count': 0  # TODO: Implement when trades tracking is added
             }
-            
-        finally:
-            conn.close()
     
-    def list_all_users(self) -> List[dict]:
+    def list_all_users(self, limit: Optional[int] = None, offset: int = 0) -> List[dict]:
         """
         List all users (admin function).
-        
+
+        Args:
+            limit: Maximum number of users to return (None = all)
+            offset: Number of users to skip
+
         Returns:
             List of user dictionaries
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("""
-                SELECT user_id, email, name, picture, created_at, last_login, is_active, is_admin
-                FROM users
-                ORDER BY created_at DESC
-            """)
-            
-            users = []
-            for row in cursor.fetchall():
-                users.append({
-                    'user_id': row[0],
-                    'email': row[1],
-                    'name': row[2],
-                    'picture': row[3],
-                    'created_at': row[4],
-                    'last_login': row[5],
-                    'is_active': bool(row[6]),
-                    'is_admin': bool(row[7])
-                })
-            
-            return users
-            
-        finally:
-            conn.close()
+        with self.get_read_conn() as conn:
+            # LIMIT -1 means no limit in SQLite
+            cursor = conn.execute(self._Q_LIST_USERS, (-1 if limit is None else limit, offset))
+            cursor.row_factory = sqlite3.Row
+
+            return [_row_to_user(row) for row in cursor]
     
     def count_users(self) -> int:
         """Count total users."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("SELECT COUNT(*) FROM users")
-            return cursor.fetchone()[0]
-        finally:
-            conn.close()
+        return self._get_user_counts()[0]
     
     def count_active_users(self) -> int:
         """Count active users."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("SELECT COUNT(*) FROM users WHERE is_active = 1")
-            return cursor.fetchone()[0]
-        finally:
-            conn.close()
+        return self._get_user_counts()[1]
+
+    def _get_user_counts(self) -> tuple:
+        """
+        Get (total, active) user counts.
+
+        Counts are kept in memory and adjusted by this service's own writes;
+        they are reloaded from SQLite after USER_COUNT_TTL seconds to pick
+        up changes made elsewhere.
+
+        Returns:
+            tuple: (total users, active users)
+        """
+        with self._user_counts_lock:
+            if self._user_counts is not None and time.monotonic() - self._user_counts_at < USER_COUNT_TTL:
+                return self._user_counts
+
+        with self.get_read_conn() as conn:
+            total, active = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(is_active = 1), 0) FROM users"
+            ).fetchone()
+
+        with self._user_counts_lock:
+            self._user_counts = (total, active)
+            self._user_counts_at = time.monotonic()
+            return self._user_counts
+
+    def _adjust_user_counts(self, total: int = 0, active: int = 0):
+        """Apply a write's effect to the cached counts (if loaded)."""
+        with self._user_counts_lock:
+            if self._user_counts is not None:
+                self._user_counts = (self._user_counts[0] + total, self._user_counts[1] + active)
 
     def get_first_admin(self) -> Optional[dict]:
         """
@@ -459,35 +590,15 @@ class UserService:
         Returns:
             dict: Admin user data or None if no admin exists
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                SELECT user_id, email, name, picture, created_at, last_login, is_active, is_admin
-                FROM users 
-                WHERE is_admin = 1 AND is_active = 1
-                ORDER BY created_at ASC
-                LIMIT 1
-            """)
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(self._Q_FIRST_ADMIN)
+            cursor.row_factory = sqlite3.Row
 
             row = cursor.fetchone()
             if row:
-                return {
-                    'user_id': row[0],
-                    'email': row[1],
-                    'name': row[2],
-                    'picture': row[3],
-                    'created_at': row[4],
-                    'last_login': row[5],
-                    'is_active': bool(row[6]),
-                    'is_admin': bool(row[7])
-                }
+                return _row_to_user(row)
             return None
 
-        finally:
-            conn.close()
-
     # =================== License Key Methods ===================
     # For unified endpoint: https://domain.com/<license_key>
 
@@ -501,37 +612,46 @@ class UserService:
         Returns:
             dict: User data or None if not found/inactive
         """
-        if not license_key or len(license_key) < 10:
+        if not license_key or not _is_license_key_format(license_key):
+            return None
+
+        entry = self._lookup_license_key(license_key)
+        if entry is None:
             return None
 
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        user = dict(entry[0])
+        user['license_key'] = license_key
+        return user
 
-        try:
-            cursor.execute("""
-                SELECT user_id, email, name, picture, created_at, last_login, 
-                       is_active, is_admin, license_key
-                FROM users 
-                WHERE license_key = ? AND is_active = 1
-            """, (license_key,))
+    def _lookup_license_key(self, license_key: str) -> Optional[tuple]:
+        """
+        Resolve an active user's license key through the TTL cache.
 
+        Args:
+            license_key: License key from URL path
+
+        Returns:
+            tuple: (user dict, webhook_secret) or None if not found/inactive
+        """
+        key = _license_cache_key(license_key)
+        entry = _license_key_cache.get(key)
+        if entry is not None:
+            return entry
+
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(self._Q_GET_BY_LICENSE_KEY, (license_key,))
+            cursor.row_factory = sqlite3.Row
             row = cursor.fetchone()
-            if row:
-                return {
-                    'user_id': row[0],
-                    'email': row[1],
-                    'name': row[2],
-                    'picture': row[3],
-                    'created_at': row[4],
-                    'last_login': row[5],
-                    'is_active': bool(row[6]),
-                    'is_admin': bool(row[7]),
-                    'license_key': row[8]
-                }
+
+        # Unknown keys are not cached so invalid keys can't fill the cache
+        if not row:
             return None
 
-        finally:
-            conn.close()
+        user = _row_to_user(row)
+        secret = user.pop('webhook_secret')
+        entry = (user, secret)
+        _license_key_cache.set(key, entry)
+        return entry
 
     def get_user_license_key(self, user_id: str) -> Optional[str]:
         """
@@ -543,18 +663,13 @@ class UserService:
         Returns:
             str: License key or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(
                 "SELECT license_key FROM users WHERE user_id = ?",
                 (user_id,)
             )
             row = cursor.fetchone()
             return row[0] if row else None
-        finally:
-            conn.close()
 
     def regenerate_license_key(self, user_id: str) -> Optional[str]:
         """
@@ -568,29 +683,56 @@ class UserService:
         Returns:
             str: New license key or None if failed
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self.get_conn() as conn:
+            try:
+                new_key = self.generate_license_key()
 
-        try:
-            new_key = self.generate_license_key()
-
-            cursor.execute("""
-                UPDATE users 
-                SET license_key = ?
-                WHERE user_id = ?
-            """, (new_key, user_id))
-            conn.commit()
-
-            if cursor.rowcount > 0:
-                logger.info(f"[USER_SERVICE] Regenerated license key for user: {user_id}")
-                return new_key
-            return None
+                cursor = conn.execute("""
+                    UPDATE users 
+                    SET license_key = ?
+                    WHERE user_id = ?
+                """, (new_key, user_id))
+                _license_key_cache.clear()
 
-        except sqlite3.Error as e:
-            logger.error(f"[USER_SERVICE] Error regenerating license key: {e}")
-            return None
-        finally:
-            conn.close()
+                if cursor.rowcount > 0:
+                    logger.info(f"[USER_SERVICE] Regenerated license key for user: {user_id}")
+                    return new_key
+                return None
+
+            except sqlite3.Error as e:
+                logger.error(f"[USER_SERVICE] Error regenerating license key: {e}")
+                return None
+
+    def regenerate_credentials(self, user_id: str) -> Optional[dict]:
+        """
+        Generate a new license key and webhook secret in one UPDATE.
+
+        Args:
+            user_id: User ID
+
+        Returns:
+            dict: {license_key, webhook_secret} or None if failed
+        """
+        with self.get_conn() as conn:
+            try:
+                new_key = self.generate_license_key()
+                new_secret = self.generate_webhook_secret()
+
+                cursor = conn.execute("""
+                    UPDATE users 
+                    SET license_key = ?, webhook_secret = ?
+                    WHERE user_id = ?
+                """, (new_key, new_secret, user_id))
+                _license_key_cache.clear()
+
+                if cursor.rowcount > 0:
+                    logger.info(f"[USER_SERVICE] Regenerated credentials for user: {user_id}")
+                    return {'license_key': new_key, 'webhook_secret': new_secret}
+                return None
+
+            except sqlite3.Error as e:
+                logger.error(f"[USER_SERVICE] Error regenerating credentials: {e}")
+                return None
 
     def get_user_accounts_list(self, user_id: str) -> List[str]:
         """
@@ -602,17 +744,9 @@ class UserService:
         Returns:
             List[str]: List of account numbers
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(
-                "SELECT account FROM accounts WHERE user_id = ?",
-                (user_id,)
-            )
-            return [row[0] for row in cursor.fetchall()]
-        finally:
-            conn.close()
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(self._Q_ACCOUNTS_LIST, (user_id,))
+            return [row[0] for row in cursor]
 
     def get_webhook_url(self, user_id: str) -> Optional[str]:
         """
@@ -624,11 +758,8 @@ class UserService:
         Returns:
             str: Full webhook URL or None
         """
-        license_key = self.get_user_license_key(user_id)
-        if license_key:
-            base_url = os.getenv('EXTERNAL_BASE_URL', 'http://localhost:5000')
-            return f"{base_url}/{license_key}"
-        return None
+        credentials = self.get_user_credentials(user_id)
+        return credentials['webhook_url'] if credentials else None
 
     # =================== Per-User Webhook Secret Methods ===================
     # For request validation: License Key identifies user, Secret validates authenticity
@@ -643,18 +774,13 @@ class UserService:
         Returns:
             str: Webhook secret or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(
                 "SELECT webhook_secret FROM users WHERE user_id = ?",
                 (user_id,)
             )
             row = cursor.fetchone()
             return row[0] if row else None
-        finally:
-            conn.close()
 
     def get_webhook_secret_by_license_key(self, license_key: str) -> Optional[str]:
         """
@@ -667,23 +793,17 @@ class UserService:
         Returns:
             str: Webhook secret or None (if not set or empty)
         """
-        if not license_key or len(license_key) < 10:
+        if not license_key or not _is_license_key_format(license_key):
             return None
 
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(
-                "SELECT webhook_secret FROM users WHERE license_key = ? AND is_active = 1",
-                (license_key,)
-            )
-            row = cursor.fetchone()
-            if row and row[0] and len(str(row[0]).strip()) > 0:
-                return row[0]
+        entry = self._lookup_license_key(license_key)
+        if entry is None:
             return None
-        finally:
-            conn.close()
+
+        secret = entry[1]
+        if secret and len(str(secret).strip()) > 0:
+            return secret
+        return None
 
     def has_webhook_secret(self, license_key: str) -> bool:
         """
@@ -707,11 +827,8 @@ class UserService:
         Returns:
             dict: {has_secret: bool, secret: str|None}
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(
                 "SELECT webhook_secret FROM users WHERE user_id = ?",
                 (user_id,)
             )
@@ -724,8 +841,6 @@ class UserService:
                     'secret': secret if has_secret else None
                 }
             return {'has_secret': False, 'secret': None}
-        finally:
-            conn.close()
 
     def get_webhook_secret(self, user_id: str) -> Optional[str]:
         """
@@ -754,27 +869,23 @@ class UserService:
         if not secret or not secret.strip():
             return self.clear_webhook_secret(user_id)
 
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self.get_conn() as conn:
+            try:
+                cursor = conn.execute("""
+                    UPDATE users 
+                    SET webhook_secret = ?
+                    WHERE user_id = ?
+                """, (secret.strip(), user_id))
+                _license_key_cache.clear()
 
-        try:
-            cursor.execute("""
-                UPDATE users 
-                SET webhook_secret = ?
-                WHERE user_id = ?
-            """, (secret.strip(), user_id))
-            conn.commit()
-
-            if cursor.rowcount > 0:
-                logger.info(f"[USER_SERVICE] Set webhook secret for user: {user_id}")
-                return True
-            return False
+                if cursor.rowcount > 0:
+                    logger.info(f"[USER_SERVICE] Set webhook secret for user: {user_id}")
+                    return True
+                return False
 
-        except sqlite3.Error as e:
-            logger.error(f"[USER_SERVICE] Error setting webhook secret: {e}")
-            return False
-        finally:
-            conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"[USER_SERVICE] Error setting webhook secret: {e}")
+                return False
 
     def validate_webhook_secret(self, license_key: str, provided_secret: str) -> bool:
         """
@@ -798,7 +909,6 @@ class UserService:
         # Use constant-time comparison to prevent timing attacks
         return secrets.compare_digest(expected_secret, provided_secret)
 
-
     def regenerate_webhook_secret(self, user_id: str) -> Optional[str]:
         """
         Generate new webhook secret for user (invalidates old secret).
@@ -811,29 +921,25 @@ class UserService:
         Returns:
             str: New webhook secret or None if failed
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self.get_conn() as conn:
+            try:
+                new_secret = self.generate_webhook_secret()
 
-        try:
-            new_secret = self.generate_webhook_secret()
-
-            cursor.execute("""
-                UPDATE users 
-                SET webhook_secret = ?
-                WHERE user_id = ?
-            """, (new_secret, user_id))
-            conn.commit()
-
-            if cursor.rowcount > 0:
-                logger.info(f"[USER_SERVICE] Regenerated webhook secret for user: {user_id}")
-                return new_secret
-            return None
+                cursor = conn.execute("""
+                    UPDATE users 
+                    SET webhook_secret = ?
+                    WHERE user_id = ?
+                """, (new_secret, user_id))
+                _license_key_cache.clear()
 
-        except sqlite3.Error as e:
-            logger.error(f"[USER_SERVICE] Error regenerating webhook secret: {e}")
-            return None
-        finally:
-            conn.close()
+                if cursor.rowcount > 0:
+                    logger.info(f"[USER_SERVICE] Regenerated webhook secret for user: {user_id}")
+                    return new_secret
+                return None
+
+            except sqlite3.Error as e:
+                logger.error(f"[USER_SERVICE] Error regenerating webhook secret: {e}")
+                return None
 
     def clear_webhook_secret(self, user_id: str) -> bool:
         """
@@ -846,27 +952,23 @@ class UserService:
         Returns:
             bool: True if successful
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self.get_conn() as conn:
+            try:
+                cursor = conn.execute("""
+                    UPDATE users 
+                    SET webhook_secret = NULL
+                    WHERE user_id = ?
+                """, (user_id,))
+                _license_key_cache.clear()
 
-        try:
-            cursor.execute("""
-                UPDATE users 
-                SET webhook_secret = NULL
-                WHERE user_id = ?
-            """, (user_id,))
-            conn.commit()
-
-            if cursor.rowcount > 0:
-                logger.info(f"[USER_SERVICE] Cleared webhook secret for user: {user_id}")
-                return True
-            return False
+                if cursor.rowcount > 0:
+                    logger.info(f"[USER_SERVICE] Cleared webhook secret for user: {user_id}")
+                    return True
+                return False
 
-        except sqlite3.Error as e:
-            logger.error(f"[USER_SERVICE] Error clearing webhook secret: {e}")
-            return False
-        finally:
-            conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"[USER_SERVICE] Error clearing webhook secret: {e}")
+                return False
 
     def get_user_credentials(self, user_id: str) -> Optional[dict]:
         """
@@ -878,14 +980,8 @@ class UserService:
         Returns:
             dict: {license_key, webhook_secret, has_secret, webhook_url} or None
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(
-                "SELECT license_key, webhook_secret FROM users WHERE user_id = ?",
-                (user_id,)
-            )
+        with self.get_read_conn() as conn:
+            cursor = conn.execute(self._Q_CREDENTIALS, (user_id,))
             row = cursor.fetchone()
             if row and row[0]:
                 base_url = os.getenv('EXTERNAL_BASE_URL', 'http://localhost:5000')
@@ -897,5 +993,7 @@ class UserService:
                     'webhook_url': f"{base_url}/{row[0]}"
                 }
             return None
-        finally:
-            conn.close()
+
+
+# Shared instance (pool, schema check and caches are set up once per process)
+user_service = UserService()
@@ -2,17 +2,165 @@
 Webhook Service
 Handles webhook request processing, validation, and command execution
 """
+import sys
+import time
 import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+
+from app.core.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+try:
+    import fastjsonschema
+    HAS_FASTJSONSCHEMA = True
+except ImportError:
+    HAS_FASTJSONSCHEMA = False
+
+# Action aliases mapping
+_ACTION_ALIASES = {
+    'CALL': 'BUY',
+    'PUT': 'SELL',
+    'LONG': 'BUY',
+    'SHORT': 'SELL',
+}
+
+# Action groups (interned, so comparisons against normalized actions are identity checks)
+_TRADING_ACTIONS = frozenset(map(sys.intern, ('BUY', 'SELL')))
+_CLOSING_ACTIONS = frozenset(map(sys.intern, ('CLOSE', 'CLOSE_ALL', 'CLOSE_SYMBOL')))
+_POSITION_TYPES = frozenset(map(sys.intern, ('BUY', 'SELL')))
+
+# Already-normalized actions (returned as-is by normalize_action)
+_KNOWN_ACTIONS = _TRADING_ACTIONS | _CLOSING_ACTIONS
+
+# Order types that need a price
+_NEEDS_PRICE = frozenset(('limit', 'stop'))
+
+# How long an account's exists/status/heartbeat check is reused (seconds)
+ACCOUNT_SNAPSHOT_TTL = 0.25
+
+# Identical commands to the same account within this window are sent once
+DUPLICATE_COMMAND_WINDOW = 1.0
+RECENT_COMMANDS_MAX = 2048
+
+# Returned by write_command_for_ea(s) for a repeat dropped within the window
+COMMAND_DUPLICATE = 'duplicate'
+
+_POSITIVE_NUMBER = {'type': 'number', 'exclusiveMinimum': 0}
+
+# Strict subset of what validate_webhook_payload accepts: a payload that
+# passes this schema is valid, anything else goes through the manual
+# checks (which also produce the user-facing error message)
+WEBHOOK_PAYLOAD_SCHEMA = {
+    'type': 'object',
+    'required': ['action'],
+    'anyOf': [{'required': ['account_number']}, {'required': ['accounts']}],
+    'oneOf': [
+        {
+            'properties': {
+                'action': {'enum': ['BUY', 'SELL']},
+                'volume': _POSITIVE_NUMBER,
+                'order_type': {'enum': ['market', 'limit', 'stop']},
+            },
+            'required': ['symbol', 'volume'],
+            'if': {
+                'properties': {'order_type': {'enum': ['limit', 'stop']}},
+                'required': ['order_type'],
+            },
+            'then': {'required': ['price']},
+        },
+        {
+            'properties': {
+                'action': {'enum': ['CLOSE', 'CLOSE_ALL', 'CLOSE_SYMBOL']},
+                'volume': _POSITIVE_NUMBER,
+                'ticket': {'type': 'integer'},
+                'position_type': {'enum': ['BUY', 'SELL']},
+            },
+            'allOf': [
+                {
+                    'if': {'properties': {'action': {'const': 'CLOSE'}}},
+                    'then': {'anyOf': [{'required': ['ticket']}, {'required': ['symbol']}]},
+                },
+                {
+                    'if': {'properties': {'action': {'const': 'CLOSE_SYMBOL'}}},
+                    'then': {'required': ['symbol']},
+                },
+            ],
+        },
+    ],
+}
+
+_INVALID_ACTION_ERROR = 'Invalid action. Must be one of: BUY, SELL, LONG, SHORT, CALL, PUT, CLOSE, CLOSE_ALL, CLOSE_SYMBOL'
+
+
+@lru_cache(maxsize=1024)
+def _validate_shape(action: str, order_type: str, keys: FrozenSet[str]) -> Optional[str]:
+    """
+    Check that a payload has the fields its action needs (no value checks)
+
+    Args:
+        action: Normalized action
+        order_type: Lower-cased order type ('' for non-trading actions)
+        keys: Field names present in the payload
+
+    Returns:
+        str: Error message, or None if the shape is valid
+    """
+    if action in _TRADING_ACTIONS:
+        if 'symbol' not in keys:
+            return 'symbol required for trading actions'
+        if 'volume' not in keys:
+            return 'volume required for trading actions'
+        if order_type in _NEEDS_PRICE and 'price' not in keys:
+            return f'price required for {order_type} orders'
+    elif action in _CLOSING_ACTIONS:
+        if action == 'CLOSE' and 'ticket' not in keys and 'symbol' not in keys:
+            return 'ticket or symbol required for CLOSE action'
+        if action == 'CLOSE_SYMBOL' and 'symbol' not in keys:
+            return 'symbol required for CLOSE_SYMBOL action'
+    else:
+        return _INVALID_ACTION_ERROR
+    return None
+
+
+def _command_key(account: str, command: Dict) -> Optional[Tuple[Any, ...]]:
+    """Identity of a command for duplicate detection (None if unhashable)"""
+    key = (
+        str(account),
+        command.get('action'),
+        command.get('symbol'),
+        command.get('volume'),
+        command.get('order_type'),
+        command.get('price'),
+        command.get('take_profit'),
+        command.get('stop_loss'),
+        command.get('ticket'),
+        command.get('position_type'),
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
 
 class WebhookService:
     """Service for handling webhook operations and trading commands"""
 
-    def __init__(self, session_manager, command_queue, record_and_broadcast_fn, logger_instance=None):
+    __slots__ = (
+        'session_manager', 'command_queue', 'record_and_broadcast', 'logger',
+        '_account_snapshots', '_recent_commands', '_recent_lock',
+    )
+
+    # Generated validator for the common (well-formed) payload, compiled once
+    _validator = fastjsonschema.compile(WEBHOOK_PAYLOAD_SCHEMA) if HAS_FASTJSONSCHEMA else None
+
+    def __init__(self, session_manager, command_queue, record_and_broadcast_fn: Callable[[Dict], None],
+                 logger_instance: Optional[logging.Logger] = None):
         """
         Initialize Webhook Service
 
@@ -27,8 +175,15 @@ class WebhookService:
         self.record_and_broadcast = record_and_broadcast_fn
         self.logger = logger_instance or logger
 
+        # Short-lived per-account (exists, status, alive) lookups
+        self._account_snapshots = TTLCache(maxsize=1024, ttl=ACCOUNT_SNAPSHOT_TTL)
+
+        # Recently sent commands, for dropping exact repeats
+        self._recent_commands = OrderedDict()
+        self._recent_lock = threading.Lock()
+
         # ✅ Debug: ยืนยันว่าได้รับ command_queue
-        self.logger.info(f"[WEBHOOK_SERVICE] Initialized with command_queue: {type(command_queue)}")
+        self.logger.info("[WEBHOOK_SERVICE] Initialized with command_queue: %s", type(command_queue))
         if command_queue is None:
             self.logger.error("[WEBHOOK_SERVICE] ❌❌❌ command_queue is None!")
         else:
@@ -49,15 +204,15 @@ class WebhookService:
         if not action:
             return action
 
-        action_upper = str(action).upper().strip()
-
-        # Action aliases mapping
-        action_aliases = {
-            'CALL': 'BUY',
-            'PUT': 'SELL',
-        }
+        if isinstance(action, str):
+            # Common case: already an upper-case action, nothing to do
+            if action in _KNOWN_ACTIONS:
+                return action
+            action_upper = action.upper().strip()
+        else:
+            action_upper = str(action).upper().strip()
 
-        return action_aliases.get(action_upper, action_upper)
+        return sys.intern(_ACTION_ALIASES.get(action_upper, action_upper))
 
     def validate_webhook_payload(self, data: Dict) -> Dict[str, Any]:
         """
@@ -76,50 +231,65 @@ class WebhookService:
             if field not in data:
                 return {'valid': False, 'error': f'Missing field: {field}'}
 
-        # Normalize action aliases (call->buy, put->sell)
+        # Normalize action aliases (call/long->buy, put/short->sell)
         action = self.normalize_action(data['action'])
         data['action'] = action  # Update data with normalized action
 
-        if action in ['BUY', 'SELL', 'LONG', 'SHORT']:
-            if 'symbol' not in data:
-                return {'valid': False, 'error': 'symbol required for trading actions'}
-            if 'volume' not in data:
-                return {'valid': False, 'error': 'volume required for trading actions'}
-            data.setdefault('order_type', 'market')
-            order_type = str(data.get('order_type', 'market')).lower()
-            if order_type in ['limit', 'stop'] and 'price' not in data:
-                return {'valid': False, 'error': f'price required for {order_type} orders'}
+        # Fast path: well-formed payloads pass the compiled schema in one call
+        if self._validator is not None:
+            try:
+                self._validator(data)
+            except fastjsonschema.JsonSchemaException:
+                pass  # Fall through to the checks below for the exact error
+            else:
+                # Stored lower-cased for prepare_trading_command (close actions included)
+                data['order_type'] = str(data.get('order_type', 'market')).lower()
+                # Store coerced values so prepare_trading_command needn't convert again
+                if 'volume' in data:
+                    data['volume'] = float(data['volume'])
+                if action == 'CLOSE' and 'ticket' in data:
+                    data['ticket'] = int(data['ticket'])
+                return {'valid': True}
+
+        if not isinstance(action, str):
+            return {'valid': False, 'error': _INVALID_ACTION_ERROR}
+
+        # Structural checks depend only on the payload's shape, so they are cached
+        is_trading = action in _TRADING_ACTIONS
+        order_type = str(data.get('order_type', 'market')).lower()
+        error = _validate_shape(action, order_type if is_trading else '', frozenset(data))
+        if error:
+            return {'valid': False, 'error': error}
+
+        # Stored lower-cased for prepare_trading_command (close actions included)
+        data['order_type'] = order_type
+
+        # Value checks
+        if is_trading:
             try:
-                vol = float(data['volume'])
+                # Coerced values are stored so prepare_trading_command needn't convert again
+                data['volume'] = vol = float(data['volume'])
                 if vol <= 0:
                     return {'valid': False, 'error': 'Volume must be positive'}
             except Exception:
                 return {'valid': False, 'error': 'Volume must be a number'}
-
-        elif action in ['CLOSE', 'CLOSE_ALL', 'CLOSE_SYMBOL']:
-            if action == 'CLOSE':
-                if 'ticket' not in data and 'symbol' not in data:
-                    return {'valid': False, 'error': 'ticket or symbol required for CLOSE action'}
-                if 'ticket' in data:
-                    try:
-                        int(data['ticket'])
-                    except Exception:
-                        return {'valid': False, 'error': 'ticket must be a number'}
-            if action == 'CLOSE_SYMBOL' and 'symbol' not in data:
-                return {'valid': False, 'error': 'symbol required for CLOSE_SYMBOL action'}
+        else:
+            if action == 'CLOSE' and 'ticket' in data:
+                try:
+                    data['ticket'] = int(data['ticket'])
+                except Exception:
+                    return {'valid': False, 'error': 'ticket must be a number'}
             if 'volume' in data:
                 try:
-                    vol = float(data['volume'])
+                    data['volume'] = vol = float(data['volume'])
                     if vol <= 0:
                         return {'valid': False, 'error': 'Volume must be positive'}
                 except Exception:
                     return {'valid': False, 'error': 'Volume must be a number'}
             if 'position_type' in data:
                 pt = str(data['position_type']).upper()
-                if pt not in ['BUY', 'SELL']:
+                if pt not in _POSITION_TYPES:
                     return {'valid': False, 'error': 'position_type must be BUY or SELL'}
-        else:
-            return {'valid': False, 'error': 'Invalid action. Must be one of: BUY, SELL, LONG, SHORT, CALL, PUT, CLOSE, CLOSE_ALL, CLOSE_SYMBOL'}
 
         return {'valid': True}
 
@@ -134,127 +304,334 @@ class WebhookService:
             dict: {'success': bool, 'message': str, 'error': str (if failed)}
         """
         try:
-            target_accounts = data['accounts'] if 'accounts' in data else [data['account_number']]
-            action = str(data['action']).upper()
+            # Most webhooks target a single account
+            if not data.get('accounts'):
+                if 'account_number' not in data:
+                    return {'success': False, 'error': 'Missing field: account_number or accounts'}
+                return self._process_single(data)
+
+            target_accounts = self._target_accounts(data)
+            action = data['action']  # normalized during validation
 
             # Use symbol that was already translated from webhook handler
             mapped_symbol = data.get('symbol')
 
-            results = []
-
-            for account in target_accounts:
-                account_str = str(account).strip()
-
-                # 1. Check if account exists in system
-                if not self.session_manager.account_exists(account_str):
-                    error_msg = f'Account {account_str} not found in system'
-                    self.logger.error(f"[WEBHOOK_ERROR] {error_msg}")
-
-                    self.record_and_broadcast({
-                        'status': 'error',
-                        'action': action,
-                        'symbol': data.get('symbol', '-'),
-                        'account': account_str,
-                        'volume': data.get('volume', ''),
-                        'price': data.get('price', ''),
-                        'message': f'❌ {error_msg}'
-                    })
-
-                    results.append({'account': account_str, 'success': False, 'error': error_msg})
-                    continue
-
-                # Check status column first (more reliable than heartbeat)
-                account_info = self.session_manager.get_account_info(account_str)
-                account_status = account_info.get('status', '') if account_info else ''
-
-                if account_status == 'Offline':
-                    error_msg = f'Account {account_str} Offline'
-                    self.logger.warning(f"[WEBHOOK_ERROR] {error_msg}")
-
-                    self.record_and_broadcast({
-                        'status': 'error',
-                        'action': action,
-                        'symbol': data.get('symbol', '-'),
-                        'account': account_str,
-                        'volume': data.get('volume', ''),
-                        'price': data.get('price', ''),
-                        'message': 'Account Offline'
-                    })
-
-                    results.append({'account': account_str, 'success': False, 'error': error_msg})
-                    continue
-
-                # Backup check: heartbeat
-                if not self.session_manager.is_instance_alive(account_str):
-                    error_msg = f'Account {account_str} Offline'
-                    self.logger.warning(f"[WEBHOOK_ERROR] {error_msg}")
-
-                    self.record_and_broadcast({
-                        'status': 'error',
-                        'action': action,
-                        'symbol': data.get('symbol', '-'),
-                        'account': account_str,
-                        'volume': data.get('volume', ''),
-                        'price': data.get('price', ''),
-                        'message': 'Account Offline'
-                    })
-
-                    results.append({'account': account_str, 'success': False, 'error': error_msg})
-                    continue
-
-                # Account passed checks - send command
-                cmd = self.prepare_trading_command(data, mapped_symbol, account_str)
-                ok = self.write_command_for_ea(account_str, cmd)
-
-                if ok:
-                    self.record_and_broadcast({
-                        'status': 'success',
-                        'action': action,
-                        'order_type': data.get('order_type', 'market'),
-                        'symbol': mapped_symbol or data.get('symbol', '-'),
-                        'account': account_str,
-                        'volume': data.get('volume', ''),
-                        'price': data.get('price', ''),
-                        'tp': data.get('take_profit', ''),
-                        'sl': data.get('stop_loss', ''),
-                        'message': f'{action} command sent to EA'
-                    })
-
-                    results.append({'account': account_str, 'success': True, 'command': cmd, 'action': action})
-                else:
-                    error_msg = 'Failed to write command file'
-
-                    self.record_and_broadcast({
-                        'status': 'error',
-                        'action': action,
-                        'order_type': data.get('order_type', 'market'),
-                        'symbol': mapped_symbol or data.get('symbol', '-'),
-                        'account': account_str,
-                        'volume': data.get('volume', ''),
-                        'price': data.get('price', ''),
-                        'tp': data.get('take_profit', ''),
-                        'sl': data.get('stop_loss', ''),
-                        'message': f'{error_msg}'
-                    })
-
-                    results.append({'account': account_str, 'success': False, 'error': error_msg})
-
-            # Summarize results
-            success_count = sum(1 for r in results if r['success'])
-            total_count = len(results)
-
-            if success_count == total_count:
-                return {'success': True, 'message': f'{action} sent to {success_count}/{total_count} accounts'}
-            elif success_count > 0:
-                return {'success': True, 'message': f'{action} partial success: {success_count}/{total_count} accounts'}
-            else:
-                return {'success': False, 'error': f'Failed to send {action} to any account'}
+            # One registry lookup for all accounts, then all commands are
+            # queued in one batch
+            snapshots = self._account_snapshots_for(target_accounts)
+            common = self._error_event_base(data, action)
+            failures = [self._check_account(common, account, snapshots[account]) for account in target_accounts]
+
+            outcomes = self._send_commands(data, mapped_symbol, action, target_accounts, failures)
+            return self._summarize_outcomes(action, outcomes)
 
         except Exception as e:
-            self.logger.error(f"[WEBHOOK_ERROR] {e}", exc_info=True)
+            self.logger.error("[WEBHOOK_ERROR] %s", e, exc_info=True)
             return {'success': False, 'error': str(e)}
 
-    def prepare_trading_command(self, data: Dict, mapped_symbol: Optional[str], account: str) -> Dict:
+    def _process_single(self, data: Dict) -> Dict[str, Any]:
+        """
+        process_webhook for a payload with only account_number (no lists/batching)
+
+        Args:
+            data: Validated webhook payload
+
+        Returns:
+            dict: {'success': bool, 'message': str, 'error': str (if failed)}
+        """
+        account_str = str(data['account_number']).strip()
+        action = data['action']  # normalized during validation
+        mapped_symbol = data.get('symbol')
+
+        snapshot = self._account_snapshots_for([account_str])[account_str]
+        outcome = self._check_account(self._error_event_base(data, action), account_str, snapshot)
+        if outcome is None:
+            cmd = self._command_template(data, mapped_symbol, action, datetime.now().isoformat())
+            cmd['account'] = account_str
+            sent = self.write_command_for_ea(account_str, cmd)
+            outcome = self._command_outcome(data, mapped_symbol, action, account_str, cmd, sent)
+
+        return self._summarize_outcomes(action, [outcome])
+
+    def _target_accounts(self, data: Dict) -> List[str]:
+        """
+        Normalized, de-duplicated target accounts of a webhook (order kept)
+
+        A repeated account would otherwise get the command twice.
+
+        Args:
+            data: Validated webhook payload
+
+        Returns:
+            List[str]: Account numbers
+        """
+        accounts = data.get('accounts') or [data['account_number']]
+        return list(dict.fromkeys(str(account).strip() for account in accounts))
+
+    def _summarize_outcomes(self, action: str, outcomes: List[Tuple[Dict, Dict]]) -> Dict[str, Any]:
+        """
+        Record per-account events (in account order) and build the webhook response
+
+        Args:
+            action: Upper-cased action
+            outcomes: (result, event) pairs, one per target account
+
+        Returns:
+            dict: {'success': bool, 'message': str, 'error': str (if failed)}
+        """
+        record_and_broadcast = self.record_and_broadcast
+        success_count = 0
+        duplicate_count = 0
+        total_count = 0
+        for result, event in outcomes:
+            record_and_broadcast(event)
+            total_count += 1
+            if result['success']:
+                success_count += 1
+            elif result.get('duplicate'):
+                duplicate_count += 1
+
+        # Repeats are not failures (the first copy was queued) but are reported
+        dropped = f' ({duplicate_count} duplicate dropped)' if duplicate_count else ''
+        if success_count + duplicate_count == total_count:
+            return {'success': True, 'message': f'{action} sent to {success_count}/{total_count} accounts{dropped}'}
+        elif success_count > 0:
+            return {'success': True, 'message': f'{action} partial success: {success_count}/{total_count} accounts{dropped}'}
+        else:
+            return {'success': False, 'error': f'Failed to send {action} to any account{dropped}'}
+
+    def _check_account(self, common: Dict, account_str: str,
+                       snapshot: Tuple[bool, str, bool]) -> Optional[Tuple[Dict, Dict]]:
+        """
+        Check that one target account can receive a command
+
+        Doesn't record events itself; the caller broadcasts the returned
+        event once every account has been handled.
+
+        Args:
+            common: Event fields shared by every account (see _error_event_base)
+            account_str: Target account number
+            snapshot: (exists, status, alive) from _account_snapshots_for
+
+        Returns:
+            tuple: (result dict, trade event) if the account is rejected, None if it is ready
+        """
+        exists, account_status, alive = snapshot
+
+        # 1. Check if account exists in system
+        if not exists:
+            error_msg = f'Account {account_str} not found in system'
+            self.logger.error("[WEBHOOK_ERROR] %s", error_msg)
+            return self._account_error(common, account_str, error_msg, f'❌ {error_msg}')
+
+        # Check status column first (more reliable than heartbeat)
+        if account_status == 'Offline':
+            error_msg = f'Account {account_str} Offline'
+            self.logger.warning("[WEBHOOK_ERROR] %s", error_msg)
+            return self._account_error(common, account_str, error_msg, 'Account Offline')
+
+        # Backup check: heartbeat
+        if not alive:
+            error_msg = f'Account {account_str} Offline'
+            self.logger.warning("[WEBHOOK_ERROR] %s", error_msg)
+            return self._account_error(common, account_str, error_msg, 'Account Offline')
+
+        return None
+
+    def _account_snapshots_for(self, accounts: List[str]) -> Dict[str, Tuple[bool, str, bool]]:
+        """
+        Get (exists, status, alive) for each account, cached for ACCOUNT_SNAPSHOT_TTL
+
+        Accounts not in the cache are fetched with one
+        SessionManager.snapshot_accounts call.
+
+        Args:
+            accounts: Account numbers
+
+        Returns:
+            dict: {account: (exists, status, alive)}
+        """
+        snapshots = {}
+        missing = []
+        for account_str in accounts:
+            snapshot = self._account_snapshots.get(account_str)
+            if snapshot is None:
+                missing.append(account_str)
+            else:
+                snapshots[account_str] = snapshot
+
+        if missing:
+            snapshot_accounts = getattr(self.session_manager, 'snapshot_accounts', None)
+            if snapshot_accounts is not None:
+                fetched = snapshot_accounts(missing)
+            else:
+                fetched = {account_str: self._load_account_snapshot(account_str) for account_str in missing}
+
+            for account_str in missing:
+                snapshot = fetched[account_str]
+                self._account_snapshots.set(account_str, snapshot)
+                snapshots[account_str] = snapshot
+
+        return snapshots
+
+    def _load_account_snapshot(self, account_str: str) -> Tuple[bool, str, bool]:
+        """
+        Build one account's snapshot from the per-account SessionManager calls
+        (for session managers without snapshot_accounts)
+
+        Args:
+            account_str: Account number
+
+        Returns:
+            tuple: (exists, status, alive)
+        """
+        account_info = self.session_manager.get_account_info(account_str)
+        if not account_info:
+            snapshot = (False, '', False)
+        else:
+            account_status = account_info.get('status', '')
+            # Heartbeat only matters if the status column doesn't already say Offline
+            alive = account_status != 'Offline' and self.session_manager.is_instance_alive(account_str)
+            snapshot = (True, account_status, alive)
+        return snapshot
+
+    def _error_event_base(self, data: Dict, action: str) -> Dict:
+        """
+        Trade event fields shared by every rejected account of one webhook
+
+        Args:
+            data: Validated webhook payload
+            action: Upper-cased action
+
+        Returns:
+            dict: action/symbol/volume/price for error events
+        """
+        return {
+            'action': action,
+            'symbol': data.get('symbol', '-'),
+            'volume': data.get('volume', ''),
+            'price': data.get('price', '')
+        }
+
+    def _account_error(self, common: Dict, account_str: str, error_msg: str, ui_msg: str) -> Tuple[Dict, Dict]:
+        """
+        Build the result and trade event for an account that can't receive the command
+
+        Args:
+            common: Event fields from _error_event_base
+            account_str: Target account number
+            error_msg: Error returned in the result
+            ui_msg: Message shown in trade history
+
+        Returns:
+            tuple: (result dict, trade event for record_and_broadcast)
+        """
+        event = {'status': 'error', 'account': account_str, 'message': ui_msg, **common}
+        return {'account': account_str, 'success': False, 'error': error_msg}, event
+
+    def _send_commands(self, data: Dict, mapped_symbol: Optional[str], action: str,
+                       accounts: List[str], failures: List[Optional[Tuple[Dict, Dict]]]) -> List[Tuple[Dict, Dict]]:
+        """
+        Queue commands for every account that passed its checks in one batch
+
+        Args:
+            data: Validated webhook payload
+            mapped_symbol: Mapped/translated symbol (if available)
+            action: Upper-cased action
+            accounts: Target account numbers
+            failures: _check_account result for each account (None = ready)
+
+        Returns:
+            list: (result dict, trade event) for each account, in account order
+        """
+        ready = [account_str for account_str, failure in zip(accounts, failures) if failure is None]
+
+        # One timestamp and command body for the whole webhook
+        template = self._command_template(data, mapped_symbol, action, datetime.now().isoformat()) if ready else None
+        commands = []
+        for account_str in ready:
+            cmd = template.copy()
+            cmd['account'] = account_str
+            commands.append((account_str, cmd))
+
+        written = iter(zip(commands, self.write_commands_for_eas(commands)))
+
+        command_outcome = self._command_outcome
+        outcomes = []
+        for failure in failures:
+            if failure is not None:
+                outcomes.append(failure)
+                continue
+
+            (account_str, cmd), sent = next(written)
+            outcomes.append(command_outcome(data, mapped_symbol, action, account_str, cmd, sent))
+        return outcomes
+
+    def _command_outcome(self, data: Dict, mapped_symbol: Optional[str], action: str,
+                         account_str: str, cmd: Dict, sent: Union[bool, str]) -> Tuple[Dict, Dict]:
+        """
+        Build the result and trade event for a queued, dropped or failed command
+
+        Args:
+            data: Validated webhook payload
+            mapped_symbol: Mapped/translated symbol (if available)
+            action: Upper-cased action
+            account_str: Target account number
+            cmd: Command that was sent
+            sent: write_command_for_ea result (True, False or COMMAND_DUPLICATE)
+
+        Returns:
+            tuple: (result dict, trade event for record_and_broadcast)
+        """
+        if sent == COMMAND_DUPLICATE:
+            error_msg = f'Duplicate {action} dropped (same command sent within {DUPLICATE_COMMAND_WINDOW:g}s)'
+
+            event = {
+                'status': COMMAND_DUPLICATE,
+                'action': action,
+                'order_type': data.get('order_type', 'market'),
+                'symbol': mapped_symbol or data.get('symbol', '-'),
+                'account': account_str,
+                'volume': data.get('volume', ''),
+                'price': data.get('price', ''),
+                'tp': data.get('take_profit', ''),
+                'sl': data.get('stop_loss', ''),
+                'message': error_msg
+            }
+            return {'account': account_str, 'success': False, 'duplicate': True, 'error': error_msg}, event
+        elif sent:
+            event = {
+                'status': 'success',
+                'action': action,
+                'order_type': data.get('order_type', 'market'),
+                'symbol': mapped_symbol or data.get('symbol', '-'),
+                'account': account_str,
+                'volume': data.get('volume', ''),
+                'price': data.get('price', ''),
+                'tp': data.get('take_profit', ''),
+                'sl': data.get('stop_loss', ''),
+                'message': f'{action} command sent to EA'
+            }
+            return {'account': account_str, 'success': True, 'command': cmd, 'action': action}, event
+        else:
+            error_msg = 'Failed to write command file'
+
+            event = {
+                'status': 'error',
+                'action': action,
+                'order_type': data.get('order_type', 'market'),
+                'symbol': mapped_symbol or data.get('symbol', '-'),
+                'account': account_str,
+                'volume': data.get('volume', ''),
+                'price': data.get('price', ''),
+                'tp': data.get('take_profit', ''),
+                'sl': data.get('stop_loss', ''),
+                'message': f'{error_msg}'
+            }
+            return {'account': account_str, 'success': False, 'error': error_msg}, event
+
+    def prepare_trading_command(self, data: Dict, mapped_symbol: Optional[str], account: str,
+                                timestamp: Optional[str] = None) -> Dict:
         """
         Prepare trading command structure for EA
 
@@ -262,32 +639,39 @@ class WebhookService:
             data: Webhook data
             mapped_symbol: Mapped/translated symbol (if available)
             account: Account number
+            timestamp: Command timestamp (defaults to now)
 
         Returns:
             dict: Trading command structure
         """
-        action = str(data['action']).upper()
+        command = self._command_template(
+            data, mapped_symbol, data['action'], timestamp or datetime.now().isoformat()
+        )
+        command['account'] = str(account)
+        return command
 
-        # Normalize LONG/SHORT to BUY/SELL for EA compatibility
-        if action == 'LONG':
-            action = 'BUY'
-        elif action == 'SHORT':
-            action = 'SELL'
+    def _command_template(self, data: Dict, mapped_symbol: Optional[str], action: str, timestamp: str) -> Dict:
+        """
+        Build the account-independent part of a trading command
 
-        # Coerce volume to float if possible
-        vol = data.get('volume')
-        try:
-            volume = float(vol) if vol is not None else None
-        except Exception:
-            volume = vol  # keep original; EA may handle/raise
+        Multi-account webhooks build this once and copy it per account.
+
+        Args:
+            data: Webhook data
+            mapped_symbol: Mapped/translated symbol (if available)
+            action: Upper-cased action
+            timestamp: Command timestamp
 
-        command = {
-            'timestamp': datetime.now().isoformat(),
+        Returns:
+            dict: Trading command with 'account' left as None
+        """
+        return {
+            'timestamp': timestamp,
             'action': action,
-            'account': str(account),
+            'account': None,
             'symbol': (mapped_symbol or data.get('symbol')),
-            'order_type': str(data.get('order_type', 'market')).lower(),
-            'volume': volume,
+            'order_type': data.get('order_type', 'market'),  # lower-cased during validation
+            'volume': data.get('volume'),  # already a float after validation
             'price': data.get('price'),
             'take_profit': data.get('take_profit'),
             'stop_loss': data.get('stop_loss'),
@@ -295,9 +679,8 @@ class WebhookService:
             'position_type': data.get('position_type'),
             'comment': data.get('comment', '')
         }
-        return command
 
-    def write_command_for_ea(self, account: str, command: Dict) -> bool:
+    def write_command_for_ea(self, account: str, command: Dict) -> Union[bool, str]:
         """
         Send command to EA via API Command Queue
 
@@ -308,19 +691,24 @@ class WebhookService:
             command: Trading command dictionary
 
         Returns:
-            bool: True if sent successfully
+            bool: True if sent successfully, or COMMAND_DUPLICATE if dropped as a repeat
         """
+        if self._is_duplicate_command(account, command):
+            return COMMAND_DUPLICATE
+
         try:
             # ✅ Debug: ตรวจสอบว่า command_queue มีอยู่หรือไม่
             if not hasattr(self, 'command_queue'):
+                self._forget_command(account, command)
                 self.logger.error("[WRITE_CMD] ❌❌❌ command_queue attribute not found! Check __init__()")
                 return False
 
             if self.command_queue is None:
+                self._forget_command(account, command)
                 self.logger.error("[WRITE_CMD] ❌❌❌ command_queue is None!")
                 return False
 
-            self.logger.debug(f"[WRITE_CMD] 🔍 command_queue type: {type(self.command_queue)}")
+            self.logger.debug("[WRITE_CMD] 🔍 command_queue type: %s", type(self.command_queue))
 
             account = str(account)
 
@@ -328,26 +716,127 @@ class WebhookService:
             success = self.command_queue.add_command(account, command)
 
             if success:
-                # ✅ Enhanced logging with queue size
-                queue_size = self.command_queue.get_queue_size(account)
-                self.logger.info(
-                    f"[WRITE_CMD] ✅ Added to queue: {command.get('action')} "
-                    f"{command.get('symbol', 'N/A')} for {account} | Queue size: {queue_size}"
-                )
+                # ✅ Enhanced logging with queue size (only counted if INFO is on)
+                if self.logger.isEnabledFor(logging.INFO):
+                    self.logger.info(
+                        "[WRITE_CMD] ✅ Added to queue: %s %s for %s | Queue size: %s",
+                        command.get('action'), command.get('symbol', 'N/A'), account,
+                        self.command_queue.get_queue_size(account)
+                    )
 
                 # ✅ Log command details for debugging
-                import json
-                self.logger.debug(f"[WRITE_CMD] Command details: {json.dumps(command, indent=2)}")
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    import json
+                    self.logger.debug("[WRITE_CMD] Command details: %s", json.dumps(command, indent=2))
             else:
-                self.logger.error(f"[WRITE_CMD] ❌ Failed to add to queue for {account}")
+                self._forget_command(account, command)
+                self.logger.error("[WRITE_CMD] ❌ Failed to add to queue for %s", account)
 
             return success
 
         except AttributeError as e:
-            self.logger.error(f"[WRITE_CMD] ❌❌❌ AttributeError: {e}")
+            self._forget_command(account, command)
+            self.logger.error("[WRITE_CMD] ❌❌❌ AttributeError: %s", e)
             self.logger.error("[WRITE_CMD] command_queue not passed during __init__()!")
             return False
         except Exception as e:
-            self.logger.error(f"[WRITE_CMD_ERROR] {e}", exc_info=True)
+            self._forget_command(account, command)
+            self.logger.error("[WRITE_CMD_ERROR] %s", e, exc_info=True)
+            return False
+
+    def write_commands_for_eas(self, commands: List[Tuple[str, Dict]]) -> List[Union[bool, str]]:
+        """
+        Send several commands to their EAs with a single queue call
+
+        Args:
+            commands: List of (account, command) pairs
+
+        Returns:
+            list: True for each command sent successfully, COMMAND_DUPLICATE for
+                  each one dropped as a repeat
+        """
+        if not commands:
+            return []
+
+        if self.command_queue is None:
+            self.logger.error("[WRITE_CMD] ❌❌❌ command_queue is None!")
+            return [False] * len(commands)
+
+        # Exact repeats (signal retries) are reported but not queued again
+        is_duplicate = self._is_duplicate_command
+        results = [
+            COMMAND_DUPLICATE if is_duplicate(account, command) else False
+            for account, command in commands
+        ]
+        pending = [
+            (index, str(account), command)
+            for index, (account, command) in enumerate(commands)
+            if results[index] is False
+        ]
+        if not pending:
+            return results
+
+        try:
+            add_bulk = getattr(self.command_queue, 'add_commands_bulk', None)
+            if add_bulk is None:
+                written = [self.command_queue.add_command(account, command) for _, account, command in pending]
+            else:
+                written = add_bulk([(account, command) for _, account, command in pending])
+
+            for (index, account, command), success in zip(pending, written):
+                results[index] = success
+                if success:
+                    self.logger.info(
+                        "[WRITE_CMD] ✅ Added to queue: %s %s for %s",
+                        command.get('action'), command.get('symbol', 'N/A'), account
+                    )
+                else:
+                    self._forget_command(account, command)
+                    self.logger.error("[WRITE_CMD] ❌ Failed to add to queue for %s", account)
+            return results
+
+        except Exception as e:
+            self.logger.error("[WRITE_CMD_ERROR] %s", e, exc_info=True)
+            for index, account, command in pending:
+                self._forget_command(account, command)
+                results[index] = False
+            return results
+
+    def _is_duplicate_command(self, account: str, command: Dict) -> bool:
+        """
+        Check (and remember) a command so exact repeats within
+        DUPLICATE_COMMAND_WINDOW seconds are dropped
+
+        Args:
+            account: Account number
+            command: Trading command dictionary
+
+        Returns:
+            bool: True if the same command was sent to this account just now
+        """
+        key = _command_key(account, command)
+        if key is None:
             return False
 
+        now = time.monotonic()
+        with self._recent_lock:
+            sent_at = self._recent_commands.get(key)
+            if sent_at is not None and now - sent_at < DUPLICATE_COMMAND_WINDOW:
+                self.logger.info(
+                    "[DEDUP] Dropped repeated %s %s for %s",
+                    command.get('action'), command.get('symbol', 'N/A'), account
+                )
+                return True
+
+            self._recent_commands[key] = now
+            self._recent_commands.move_to_end(key)
+            while len(self._recent_commands) > RECENT_COMMANDS_MAX:
+                self._recent_commands.popitem(last=False)
+        return False
+
+    def _forget_command(self, account: str, command: Dict) -> None:
+        """Forget a command that failed to queue so a retry isn't dropped as a repeat"""
+        key = _command_key(account, command)
+        if key is not None:
+            with self._recent_lock:
+                self._recent_commands.pop(key, None)
@@ -1,18 +1,51 @@
+import atexit
+import hmac
 import os
+import select
 import shutil
 import subprocess
+import sys
 import time
 import json
 import logging
-import sqlite3
-from datetime import datetime
-from typing import List, Dict, Optional
+import threading
+from datetime import datetime, timedelta
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from app.core.db_pool import get_pool
+from app.core.ttl_cache import TTLCache
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 try:
     import psutil  # process management
 except Exception:
     psutil = None  # we'll guard usage
 
+# Symbol mappings change rarely but are read on every order
+SYMBOL_MAPPING_CACHE_TTL = 60.0
+
+# The global secret is checked on every webhook; other SessionManager
+# instances' updates are picked up after this many seconds
+GLOBAL_SECRET_CACHE_TTL = 30.0
+
+# Buffered EA heartbeats are written to last_seen this often (seconds)
+HEARTBEAT_FLUSH_INTERVAL = 1.5
+
+# Minimum seconds between offline sweeps triggered by account listings
+STATUS_CHECK_INTERVAL = 30.0
+
+# Bump when _init_db gains a new migration. Stored in global_settings, since
+# PRAGMA user_version on accounts.db already belongs to UserService
+ACCOUNTS_SCHEMA_VERSION = 2
+
+# Keep WHERE ... IN (...) lists under SQLite's default 999 bound-parameter limit
+IN_CLAUSE_CHUNK = 900
+
 logger = logging.getLogger(__name__)
 if not logger.handlers:
     logging.basicConfig(
@@ -20,11 +53,141 @@ if not logger.handlers:
         format="%(asctime)s [%(levelname)s] %(message)s"
     )
 
+# Cache miss marker (a cached global secret may legitimately be None)
+_MISSING = object()
+
+
+# JSON for the symbol_mappings column (stored as TEXT) and symbol info files
+if HAS_ORJSON:
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    _json_loads = orjson.loads
+else:
+    _json_dumps = json.dumps
+    _json_loads = json.loads
+
+
+# (epoch second, formatted local time) of the last _now_iso call
+_ts_cache = (0, '')
+
+
+def _now_iso() -> str:
+    """เวลาปัจจุบันแบบ ISO-8601 ความละเอียดวินาที (format ใหม่แค่ครั้งละวินาที)"""
+    global _ts_cache
+    now = int(time.time())
+    cached = _ts_cache
+    if cached[0] != now:
+        cached = (now, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)))
+        _ts_cache = cached
+    return cached[1]
+
+
+def _mapping_entry(mappings_json: Optional[str]) -> Tuple[list, Dict[str, Optional[str]]]:
+    """
+    แปลง symbol_mappings (JSON) เป็น (list ของ mappings, {FROM ตัวใหญ่: to})
+    index เก็บ mapping แรกของแต่ละ from เหมือนการวนหาแบบเดิม
+    """
+    mappings = _json_loads(mappings_json) if mappings_json else []
+    index = {}
+    for mapping in mappings:
+        if not isinstance(mapping, dict):
+            continue
+        source = mapping.get('from', '')
+        if isinstance(source, str):
+            index.setdefault(source.upper(), mapping.get('to'))
+    return mappings, index
+
+
+def _wait_for_pid_exit(pid: int, timeout: float) -> bool:
+    """
+    รอให้ process ปิดโดยใช้ OS event (ไม่ poll แบบ psutil.wait)
+    - Windows: OpenProcess + WaitForSingleObject
+    - Linux: pidfd_open + select
+    - อื่นๆ: fallback เป็น psutil.Process.wait
+
+    Returns:
+        bool: True ถ้า process ปิดแล้ว (หรือไม่มีอยู่) ภายใน timeout
+    """
+    if sys.platform == "win32":
+        import ctypes
+        SYNCHRONIZE = 0x00100000
+        WAIT_OBJECT_0 = 0
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(SYNCHRONIZE, False, pid)
+        if handle:
+            try:
+                return kernel32.WaitForSingleObject(handle, int(timeout * 1000)) == WAIT_OBJECT_0
+            finally:
+                kernel32.CloseHandle(handle)
+    elif hasattr(os, "pidfd_open"):
+        try:
+            fd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            fd = None  # kernel ไม่รองรับ pidfd
+        if fd is not None:
+            try:
+                ready, _, _ = select.select([fd], [], [], timeout)
+                return bool(ready)
+            finally:
+                os.close(fd)
+
+    if psutil is None:
+        return False
+    try:
+        psutil.Process(pid).wait(timeout)
+        return True
+    except psutil.NoSuchProcess:
+        return True
+    except (psutil.TimeoutExpired, psutil.AccessDenied):
+        return False
+
+
+# Process names of the MT5 terminal executables
+_MT5_TERMINAL_NAMES = frozenset(("terminal64.exe", "terminal.exe"))
+
+
+def _chunked(items: List[str], size: int = IN_CLAUSE_CHUNK) -> Iterator[List[str]]:
+    """แบ่ง list เป็นช่วงละ size รายการ (สำหรับ WHERE ... IN (...))"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _account_info_from_row(row) -> Dict:
+    """แปลง row (account, nickname, status, broker, last_seen, created, symbol_received, user_id) เป็น dict"""
+    return {
+        'account': row[0],
+        'nickname': row[1] or '',
+        'status': row[2] or 'Wait for Activate',
+        'broker': row[3] or '-',
+        'last_seen': row[4],
+        'created': row[5],
+        'pid': None,
+        'symbol_received': bool(row[6]) if row[6] is not None else False,
+        'user_id': row[7] if len(row) > 7 else None
+    }
+
+
 class SessionManager:
     """
     Manages per-account portable MT5 instances.
     """
 
+    # Statements on the EA heartbeat / webhook paths, shared between methods so
+    # each pooled connection parses and plans them only once
+    _Q_STATUS = "SELECT status FROM accounts WHERE account = ?"
+    _Q_STATUS_AND_SYMBOL = "SELECT status, symbol_received FROM accounts WHERE account = ?"
+    _Q_SYMBOL_RECEIVED = "SELECT symbol_received FROM accounts WHERE account = ?"
+    _Q_SYMBOL_MAPPINGS = "SELECT symbol_mappings FROM accounts WHERE account = ?"
+    _Q_HEARTBEAT_IF_ACTIVE = "UPDATE accounts SET last_seen = ? WHERE account = ? AND symbol_received"
+    # Batched heartbeats never move last_seen backwards past a direct write
+    _Q_HEARTBEAT_BATCH = (
+        "UPDATE accounts SET last_seen = ? "
+        "WHERE account = ? AND (last_seen IS NULL OR last_seen < ?)"
+    )
+
     def __init__(self):
         self.base_dir = os.path.abspath(os.getcwd())
         self.instances_dir = os.path.abspath(
@@ -32,15 +195,55 @@ class SessionManager:
         )
         os.makedirs(self.instances_dir, exist_ok=True)
         self.mt5_path = os.getenv("MT5_PATH", r"C:\Program Files\MetaTrader 5\terminal64.exe")
-        self.profile_source = os.getenv("MT5_PROFILE_SOURCE") or self._auto_detect_profile_source()
         data_dir = os.path.join(self.base_dir, "data")
         os.makedirs(data_dir, exist_ok=True)
         self.db_path = os.path.join(data_dir, "accounts.db")
+        # Shared long-lived connections (WAL, warm page cache) instead of a
+        # fresh sqlite3.connect per call
+        self._pool = get_pool(self.db_path)
+        # account -> parsed symbol_mappings (invalidated by update_symbol_mappings)
+        self._mapping_cache = TTLCache(maxsize=1024, ttl=SYMBOL_MAPPING_CACHE_TTL)
+        self._last_status_check = 0.0
+        # symbol_info file path -> (st_mtime_ns, parsed content)
+        self._symbol_info_cache: Dict[str, Tuple[int, Dict]] = {}
+        # Global secret (None = not set), refreshed by update_global_secret
+        self._secret_cache = TTLCache(maxsize=1, ttl=GLOBAL_SECRET_CACHE_TTL)
+
+        # Pending heartbeats {account: last_seen}, written in batches by a background thread
+        self._hb_buffer: Dict[str, str] = {}
+        self._hb_lock = threading.Lock()
+        self._hb_flusher = None
         self._init_db()
 
+        # Needs the database (the detected path is cached in global_settings)
+        self.profile_source = os.getenv("MT5_PROFILE_SOURCE") or self._auto_detect_profile_source()
+
     # -------------------------- DB --------------------------
+    def close(self):
+        """ปิด connection ของ database (เรียกตอน process ปิด)"""
+        self.flush_heartbeats()
+        self._pool.close_all()
+
+    def _schema_version(self, conn) -> int:
+        """อ่าน schema version ที่ _init_db บันทึกไว้ (0 ถ้ายังไม่เคย migrate)"""
+        try:
+            row = conn.execute(
+                "SELECT value FROM global_settings WHERE key = 'accounts_schema_version'"
+            ).fetchone()
+            return int(row[0]) if row and row[0] else 0
+        except Exception:
+            # global_settings ยังไม่มี หรือยังเป็น schema เก่า (id-based)
+            return 0
+
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.get_conn() as conn:
+            # Warm installs: one query instead of re-inspecting every table
+            if self._schema_version(conn) >= ACCOUNTS_SCHEMA_VERSION:
+                return
+
+            # Pooled connections are autocommit; keep the migration all-or-nothing
+            conn.execute("BEGIN")
+
             # Accounts table
             conn.execute(
                 """
@@ -157,6 +360,17 @@ class SessionManager:
                 except Exception as e:
                     logger.warning(f"[DB] Could not migrate accounts to admin: {e}")
 
+            # Partial index matching check_account_online_status (only Online rows are indexed)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_accounts_online_lastseen "
+                "ON accounts(last_seen) WHERE status = 'Online'"
+            )
+            conn.execute("ANALYZE accounts")
+
+            conn.execute(
+                "INSERT OR REPLACE INTO global_settings (key, value) VALUES ('accounts_schema_version', ?)",
+                (str(ACCOUNTS_SCHEMA_VERSION),)
+            )
             conn.commit()
             logger.info("[DB] Database initialized successfully")
 
@@ -165,10 +379,10 @@ class SessionManager:
         ดึงรายการบัญชีทั้งหมด (เวอร์ชัน Remote)
         ⚠️ ใช้สำหรับ Admin เท่านั้น - ใช้ get_accounts_by_user สำหรับ normal users
         """
-        # เช็คสถานะก่อน
-        self.check_account_online_status()
+        # เช็คสถานะก่อน (throttled)
+        self._maybe_check_account_online_status()
 
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.read_conn() as conn:
             rows = conn.execute(
                 """
                 SELECT account, nickname, status, broker, last_seen, created, symbol_received, user_id
@@ -208,10 +422,10 @@ class SessionManager:
         Returns:
             List of account dictionaries belonging to the user
         """
-        # เช็คสถานะก่อน
-        self.check_account_online_status()
+        # เช็คสถานะก่อน (throttled)
+        self._maybe_check_account_online_status()
 
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.read_conn() as conn:
             rows = conn.execute(
                 """
                 SELECT account, nickname, status, broker, last_seen, created, symbol_received, user_id
@@ -258,7 +472,7 @@ class SessionManager:
                 logger.info(f"[REMOTE] Account {account} already exists")
                 return False
 
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.get_conn() as conn:
                 conn.execute(
                     """
                     INSERT INTO accounts
@@ -267,7 +481,6 @@ class SessionManager:
                     """,
                     (account, nickname, datetime.now().isoformat(), user_id)
                 )
-                conn.commit()
 
             logger.info(f"[REMOTE] Account {account} added for user {user_id} (waiting for EA connection)")
             return True
@@ -290,7 +503,7 @@ class SessionManager:
             bool: True if user owns this account
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.read_conn() as conn:
                 row = conn.execute(
                     "SELECT user_id FROM accounts WHERE account = ?",
                     (account,)
@@ -317,7 +530,7 @@ class SessionManager:
             str: User ID or None if not found
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.read_conn() as conn:
                 row = conn.execute(
                     "SELECT user_id FROM accounts WHERE account = ?",
                     (account,)
@@ -340,7 +553,7 @@ class SessionManager:
         Returns:
             Dict or None if not found/not owned
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.read_conn() as conn:
             row = conn.execute(
                 """
                 SELECT account, nickname, status, broker, last_seen, created, symbol_received, user_id
@@ -377,15 +590,15 @@ class SessionManager:
             bool: True if deleted, False if not found/not owned
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.get_conn() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "DELETE FROM accounts WHERE account = ? AND user_id = ?",
                     (account, user_id)
                 )
-                conn.commit()
 
                 if cursor.rowcount > 0:
+                    self._mapping_cache.pop(str(account))
                     logger.info(f"[REMOTE] Account {account} deleted by user {user_id}")
                     return True
                 else:
@@ -407,7 +620,7 @@ class SessionManager:
             int: Number of accounts
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.read_conn() as conn:
                 row = conn.execute(
                     "SELECT COUNT(*) FROM accounts WHERE user_id = ?",
                     (user_id,)
@@ -418,7 +631,7 @@ class SessionManager:
             return 0
 
     def account_exists(self, account: str) -> bool:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.read_conn() as conn:
             row = conn.execute(
                 "SELECT 1 FROM accounts WHERE account = ?", (account,)
             ).fetchone()
@@ -434,7 +647,7 @@ class SessionManager:
         Returns:
             Dict หรือ None ถ้าไม่พบบัญชี
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.read_conn() as conn:
             row = conn.execute(
                 """
                 SELECT account, nickname, status, broker, last_seen, created, symbol_received, user_id
@@ -447,17 +660,35 @@ class SessionManager:
         if not row:
             return None
 
-        return {
-            'account': row[0],
-            'nickname': row[1] or '',
-            'status': row[2] or 'Wait for Activate',
-            'broker': row[3] or '-',
-            'last_seen': row[4],
-            'created': row[5],
-            'pid': None,
-            'symbol_received': bool(row[6]) if row[6] is not None else False,
-            'user_id': row[7] if len(row) > 7 else None
-        }
+        return _account_info_from_row(row)
+
+    def get_accounts_info(self, accounts: List[str]) -> Dict[str, Optional[Dict]]:
+        """
+        ดึงข้อมูลหลายบัญชีในการ query ครั้งเดียว (แทน get_account_info ต่อ account)
+
+        Args:
+            accounts: รายการหมายเลขบัญชี
+
+        Returns:
+            Dict: {account: dict หรือ None ถ้าไม่พบบัญชี}
+        """
+        accounts = list(dict.fromkeys(accounts))
+        found = {}
+        with self._pool.read_conn() as conn:
+            for chunk in _chunked(accounts):
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f"""
+                    SELECT account, nickname, status, broker, last_seen, created, symbol_received, user_id
+                    FROM accounts
+                    WHERE account IN ({placeholders})
+                    """,
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    found[str(row[0])] = _account_info_from_row(row)
+
+        return {account: found.get(account) for account in accounts}
 
     # ============= Remote Mode Functions =============
 
@@ -471,7 +702,7 @@ class SessionManager:
                 logger.info(f"[REMOTE] Account {account} already exists")
                 return False
 
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.get_conn() as conn:
                 conn.execute(
                     """
                     INSERT INTO accounts
@@ -480,7 +711,6 @@ class SessionManager:
                     """,
                     (account, nickname, datetime.now().isoformat())
                 )
-                conn.commit()
 
             logger.info(f"[REMOTE] Account {account} added (waiting for EA connection)")
             return True
@@ -495,9 +725,9 @@ class SessionManager:
         เปลี่ยนจาก 'Wait for Activate' → 'Online'
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.get_conn() as conn:
                 row = conn.execute(
-                    "SELECT status FROM accounts WHERE account = ?",
+                    self._Q_STATUS,
                     (account,)
                 ).fetchone()
 
@@ -519,9 +749,8 @@ class SessionManager:
                         last_seen = ?
                     WHERE account = ?
                     """,
-                    (broker, datetime.now().isoformat(), account)
+                    (broker, _now_iso(), account)
                 )
-                conn.commit()
 
             logger.info(f"[REMOTE] ✅ Account {account} activated (Broker: {broker})")
             return True
@@ -541,9 +770,9 @@ class SessionManager:
             bool: True ถ้าได้รับ Symbol แล้ว
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.read_conn() as conn:
                 row = conn.execute(
-                    "SELECT symbol_received FROM accounts WHERE account = ?",
+                    self._Q_SYMBOL_RECEIVED,
                     (account,)
                 ).fetchone()
 
@@ -572,44 +801,35 @@ class SessionManager:
             bool: True ถ้า activate สำเร็จ
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                row = conn.execute(
-                    "SELECT status, symbol_received FROM accounts WHERE account = ?",
-                    (account,)
-                ).fetchone()
-
-                if not row:
-                    logger.warning(f"[SYMBOL_ACTIVATE] Account {account} not found")
-                    return False
+            with self._pool.get_conn() as conn:
+                now = _now_iso()
 
-                current_status = row[0]
-                already_received = bool(row[1])
-
-                # ถ้าได้รับ Symbol แล้ว ให้แค่อัพเดท heartbeat
-                if already_received:
-                    conn.execute(
-                        "UPDATE accounts SET last_seen = ? WHERE account = ?",
-                        (datetime.now().isoformat(), account)
-                    )
-                    conn.commit()
+                # ถ้าได้รับ Symbol แล้ว ให้แค่อัพเดท heartbeat (กรณีปกติ - statement เดียว)
+                cursor = conn.execute(
+                    self._Q_HEARTBEAT_IF_ACTIVE,
+                    (now, account)
+                )
+                if cursor.rowcount:
                     logger.info(f"[SYMBOL_ACTIVATE] Account {account} already activated, updating heartbeat")
                     return True
 
                 # ✅ Activate account เมื่อได้รับ Symbol ครั้งแรก
-                logger.info(f"[SYMBOL_ACTIVATE] 🟢 Account {account} is being ACTIVATED by Symbol data")
-
-                conn.execute(
+                cursor = conn.execute(
                     """
                     UPDATE accounts
                     SET status = 'Online',
                         broker = ?,
                         last_seen = ?,
                         symbol_received = 1
-                    WHERE account = ?
+                    WHERE account = ? AND NOT COALESCE(symbol_received, 0)
                     """,
-                    (broker, datetime.now().isoformat(), account)
+                    (broker, now, account)
                 )
-                conn.commit()
+                if not cursor.rowcount:
+                    logger.warning(f"[SYMBOL_ACTIVATE] Account {account} not found")
+                    return False
+
+                logger.info(f"[SYMBOL_ACTIVATE] 🟢 Account {account} is being ACTIVATED by Symbol data")
 
             logger.info(f"[SYMBOL_ACTIVATE] ✅ Account {account} activated by Symbol (Broker: {broker}, Symbol: {symbol})")
             return True
@@ -626,9 +846,9 @@ class SessionManager:
             tuple: (can_receive: bool, reason: str)
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.read_conn() as conn:
                 row = conn.execute(
-                    "SELECT status, symbol_received FROM accounts WHERE account = ?",
+                    self._Q_STATUS_AND_SYMBOL,
                     (account,)
                 ).fetchone()
 
@@ -660,18 +880,64 @@ class SessionManager:
     def update_account_heartbeat(self, account: str) -> bool:
         """
         อัพเดท last_seen timestamp เมื่อ EA ส่งข้อมูลมา
+
+        ไม่เขียน DB ทันที - เก็บไว้ใน buffer แล้ว background thread เขียนทีละชุด
+        ทุก HEARTBEAT_FLUSH_INTERVAL วินาที (ดู flush_heartbeats)
+
+        Returns:
+            bool: True เมื่อเข้า buffer แล้ว
+        """
+        self._start_heartbeat_flusher()
+        with self._hb_lock:
+            self._hb_buffer[str(account)] = _now_iso()
+        return True
+
+    def _start_heartbeat_flusher(self):
+        """เริ่ม background thread ที่เขียน heartbeat (ครั้งแรกที่ใช้)"""
+        if self._hb_flusher is not None:
+            return
+
+        with self._hb_lock:
+            if self._hb_flusher is None:
+                self._hb_flusher = threading.Thread(
+                    target=self._heartbeat_loop,
+                    name='HeartbeatFlusher',
+                    daemon=True
+                )
+                self._hb_flusher.start()
+                atexit.register(self.flush_heartbeats)
+
+    def _heartbeat_loop(self):
+        """Background loop: เขียน heartbeat ที่ค้างอยู่เป็นระยะ"""
+        while True:
+            time.sleep(HEARTBEAT_FLUSH_INTERVAL)
+            self.flush_heartbeats()
+
+    def flush_heartbeats(self) -> int:
         """
+        เขียน heartbeat ที่ค้างใน buffer ทั้งหมดใน transaction เดียว
+
+        Returns:
+            int: จำนวน account ที่เขียน
+        """
+        with self._hb_lock:
+            pending, self._hb_buffer = self._hb_buffer, {}
+
+        if not pending:
+            return 0
+
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    "UPDATE accounts SET last_seen = ? WHERE account = ?",
-                    (datetime.now().isoformat(), account)
+            with self._pool.get_conn() as conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    self._Q_HEARTBEAT_BATCH,
+                    [(ts, account, ts) for account, ts in pending.items()]
                 )
                 conn.commit()
-            return True
+            return len(pending)
         except Exception as e:
             logger.error(f"[HEARTBEAT_ERROR] {e}")
-            return False
+            return 0
 
     def set_account_online(self, account: str, broker: str = "") -> bool:
         """
@@ -686,38 +952,22 @@ class SessionManager:
             bool: True ถ้าอัพเดทสำเร็จ
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # ⚠️ ตรวจสอบสถานะปัจจุบันก่อน - ไม่ให้ overwrite PAUSE
-                cursor = conn.cursor()
-                cursor.execute("SELECT status FROM accounts WHERE account = ?", (account,))
-                row = cursor.fetchone()
-                if row and row[0] == 'PAUSE':
-                    logger.info(f"[SESSION] Account {account} is PAUSED - not changing to Online")
+            with self._pool.get_conn() as conn:
+                # ⚠️ ไม่ overwrite PAUSE - WHERE กันไว้แล้ว ไม่ต้อง SELECT ก่อน
+                cursor = conn.execute(
+                    """
+                    UPDATE accounts
+                    SET status = 'Online',
+                        broker = COALESCE(?, broker),
+                        last_seen = ?
+                    WHERE account = ? AND status != 'PAUSE'
+                    """,
+                    (broker or None, _now_iso(), account)
+                )
+                if not cursor.rowcount:
+                    logger.info(f"[SESSION] Account {account} is PAUSED or not found - not changing to Online")
                     return False
 
-                if broker:
-                    conn.execute(
-                        """
-                        UPDATE accounts
-                        SET status = 'Online',
-                            broker = ?,
-                            last_seen = ?
-                        WHERE account = ? AND status != 'PAUSE'
-                        """,
-                        (broker, datetime.now().isoformat(), account)
-                    )
-                else:
-                    conn.execute(
-                        """
-                        UPDATE accounts
-                        SET status = 'Online',
-                            last_seen = ?
-                        WHERE account = ? AND status != 'PAUSE'
-                        """,
-                        (datetime.now().isoformat(), account)
-                    )
-                conn.commit()
-
             logger.info(f"[SESSION] Account {account} set to Online")
             return True
 
@@ -725,6 +975,16 @@ class SessionManager:
             logger.error(f"[SET_ONLINE_ERROR] {e}")
             return False
 
+    def _maybe_check_account_online_status(self) -> None:
+        """
+        เรียก check_account_online_status อย่างมากทุก STATUS_CHECK_INTERVAL วินาที
+        (หน้า UI ที่ list บัญชีถี่ๆ จะไม่ UPDATE ทุก request)
+        """
+        now = time.monotonic()
+        if now - self._last_status_check >= STATUS_CHECK_INTERVAL:
+            self._last_status_check = now
+            self.check_account_online_status()
+
     def check_account_online_status(self) -> None:
         """
         เช็คว่าบัญชีไหนไม่มี heartbeat มานานเกิน 2 นาที
@@ -736,11 +996,10 @@ class SessionManager:
            จะไม่ถูกเปลี่ยนเป็น 'Offline'
         """
         try:
-            from datetime import timedelta
             timeout_minutes = 2
             cutoff_time = (datetime.now() - timedelta(minutes=timeout_minutes)).isoformat()
 
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.get_conn() as conn:
                 # ✅ เพิ่มเงื่อนไข: เฉพาะ Account ที่เป็น 'Online' เท่านั้นถึงจะเปลี่ยนเป็น 'Offline'
                 # ✅ และต้องมี last_seen (เคย activate แล้ว) และ heartbeat หมดอายุ
                 # Account ที่ยังเป็น 'Wait for Activate' จะไม่ถูกแตะต้อง
@@ -754,7 +1013,6 @@ class SessionManager:
                     """,
                     (cutoff_time,)
                 )
-                conn.commit()
 
         except Exception as e:
             logger.error(f"[CHECK_STATUS_ERROR] {e}")
@@ -764,9 +1022,9 @@ class SessionManager:
         ลบบัญชีออกจาก database (ไม่มี folder ให้ลบ)
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.get_conn() as conn:
                 conn.execute("DELETE FROM accounts WHERE account = ?", (account,))
-                conn.commit()
+            self._mapping_cache.pop(str(account))
 
             logger.info(f"[REMOTE] Account {account} deleted")
             return True
@@ -784,13 +1042,19 @@ class SessionManager:
         Returns:
             str: Secret Key หรือ None ถ้าไม่มี
         """
+        cached = self._secret_cache.get('secret_key', _MISSING)
+        if cached is not _MISSING:
+            return cached
+
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.read_conn() as conn:
                 row = conn.execute(
                     "SELECT value FROM global_settings WHERE key = 'secret_key'"
                 ).fetchone()
 
-                return row[0] if row and row[0] else None
+            secret = row[0] if row and row[0] else None
+            self._secret_cache.set('secret_key', secret)
+            return secret
 
         except Exception as e:
             logger.error(f"[GET_GLOBAL_SECRET_ERROR] {e}")
@@ -809,7 +1073,8 @@ class SessionManager:
         try:
             secret_key = secret_key.strip() if secret_key else None
 
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.get_conn() as conn:
+                conn.execute("BEGIN")
                 conn.execute(
                     """
                     INSERT OR REPLACE INTO global_settings (key, value)
@@ -827,6 +1092,7 @@ class SessionManager:
                 )
                 conn.commit()
 
+            self._secret_cache.set('secret_key', secret_key or None)
             logger.info(f"[GLOBAL_SECRET] Updated (enabled: {bool(secret_key)})")
             return True
 
@@ -850,8 +1116,8 @@ class SessionManager:
         if not stored_secret:
             return True
 
-        # ตรวจสอบว่าตรงกันหรือไม่
-        return str(provided_secret).strip() == stored_secret
+        # ตรวจสอบว่าตรงกันหรือไม่ (constant-time)
+        return hmac.compare_digest(str(provided_secret).strip().encode(), stored_secret.encode())
 
     # ============= Symbol Mapping Management =============
 
@@ -867,18 +1133,16 @@ class SessionManager:
             bool: True ถ้าอัพเดทสำเร็จ
         """
         try:
-            import json
-
             # แปลงเป็น JSON string
-            mappings_json = json.dumps(mappings) if mappings else None
+            mappings_json = _json_dumps(mappings) if mappings else None
 
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.get_conn() as conn:
                 conn.execute(
                     "UPDATE accounts SET symbol_mappings = ? WHERE account = ?",
                     (mappings_json, account)
                 )
-                conn.commit()
 
+            self._mapping_cache.pop(str(account))
             logger.info(f"[SYMBOL_MAPPING] Updated for account {account} ({len(mappings or [])} mappings)")
             return True
 
@@ -897,21 +1161,85 @@ class SessionManager:
             list: List ของ mappings หรือ [] ถ้าไม่มี
         """
         try:
-            import json
+            # Copies, so callers can edit the list before update_symbol_mappings
+            mappings, _ = self._cached_symbol_mappings(account)
+            return [dict(m) for m in mappings]
 
-            with sqlite3.connect(self.db_path) as conn:
-                row = conn.execute(
-                    "SELECT symbol_mappings FROM accounts WHERE account = ?",
-                    (account,)
-                ).fetchone()
+        except Exception as e:
+            logger.error(f"[GET_SYMBOL_MAPPING_ERROR] {e}")
+            return []
 
-                if row and row[0]:
-                    return json.loads(row[0])
-                return []
+    def _cached_symbol_mappings(self, account: str) -> Tuple[list, Dict[str, Optional[str]]]:
+        """
+        ดึง (mappings, index) จาก cache (อ่านจาก DB เมื่อไม่มีหรือหมดอายุ) - ดู _mapping_entry
+        ⚠️ ค่าที่คืนเป็นของ cache - ห้ามแก้ไข
+        """
+        key = str(account)
+        entry = self._mapping_cache.get(key)
+        if entry is None:
+            with self._pool.read_conn() as conn:
+                row = conn.execute(self._Q_SYMBOL_MAPPINGS, (account,)).fetchone()
+            entry = _mapping_entry(row[0] if row else None)
+            self._mapping_cache.set(key, entry)
+        return entry
+
+    def _cached_symbol_mappings_bulk(self, accounts: List[str]) -> Dict[str, tuple]:
+        """
+        เหมือน _cached_symbol_mappings แต่หลาย account
+        account ที่ไม่อยู่ใน cache จะถูกอ่านด้วย WHERE account IN (...) ครั้งเดียว
+        ⚠️ ค่าที่คืนเป็นของ cache - ห้ามแก้ไข
+        """
+        result = {}
+        missing = []
+        for account in dict.fromkeys(str(a) for a in accounts):
+            entry = self._mapping_cache.get(account)
+            if entry is None:
+                missing.append(account)
+            else:
+                result[account] = entry
+
+        if missing:
+            with self._pool.read_conn() as conn:
+                for chunk in _chunked(missing):
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = conn.execute(
+                        f"SELECT account, symbol_mappings FROM accounts WHERE account IN ({placeholders})",
+                        chunk
+                    ).fetchall()
+                    for account, mappings_json in rows:
+                        result[str(account)] = _mapping_entry(mappings_json)
+
+            for account in missing:
+                entry = result.get(account)
+                if entry is None:
+                    entry = result[account] = _mapping_entry(None)
+                self._mapping_cache.set(account, entry)
+
+        return result
+
+    def get_symbol_mappings_bulk(self, accounts: List[str]) -> Dict[str, list]:
+        """
+        ดึง Symbol Mappings ของหลาย account ในการ query ครั้งเดียว
+
+        Args:
+            accounts: รายการหมายเลขบัญชี
+
+        Returns:
+            dict: {account: list ของ mappings} ({} ถ้าเกิด error)
+        """
+        try:
+            cached = self._cached_symbol_mappings_bulk(accounts)
+            return {account: [dict(m) for m in mappings] for account, (mappings, _) in cached.items()}
 
         except Exception as e:
             logger.error(f"[GET_SYMBOL_MAPPING_ERROR] {e}")
-            return []
+            return {}
+
+    @staticmethod
+    def _apply_symbol_mapping(index: Dict[str, Optional[str]], symbol: str) -> str:
+        """คืน Symbol ปลายทางจาก index ของ _mapping_entry (case-insensitive) หรือ Symbol เดิมถ้าไม่มี mapping"""
+        mapped = index.get(symbol.upper())
+        return symbol if mapped is None else mapped
 
     def map_symbol(self, account: str, symbol: str) -> str:
         """
@@ -925,20 +1253,39 @@ class SessionManager:
             str: Symbol ปลายทาง (ไปยังโบรกเกอร์) หรือ Symbol เดิมถ้าไม่มี mapping
         """
         try:
-            mappings = self.get_symbol_mappings(account)
-
-            # หา mapping ที่ตรงกัน (case-insensitive)
-            symbol_upper = symbol.upper()
-            for mapping in mappings:
-                if mapping.get('from', '').upper() == symbol_upper:
-                    return mapping.get('to', symbol)
+            _, index = self._cached_symbol_mappings(account)
+            return self._apply_symbol_mapping(index, symbol)
 
-            # ถ้าไม่มี mapping ให้คืน symbol เดิม
+        except Exception as e:
+            logger.error(f"[MAP_SYMBOL_ERROR] {e}")
             return symbol
 
+    def map_symbols_bulk(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        """
+        แปลง Symbol ของหลาย (account, symbol) โดยอ่าน mappings ครั้งเดียว
+
+        Args:
+            pairs: รายการ (account, symbol)
+
+        Returns:
+            dict: {(account, symbol): Symbol ปลายทาง} (Symbol เดิมถ้าไม่มี mapping หรือเกิด error)
+        """
+        try:
+            by_account = self._cached_symbol_mappings_bulk([account for account, _ in pairs])
         except Exception as e:
             logger.error(f"[MAP_SYMBOL_ERROR] {e}")
-            return symbol
+            by_account = {}
+
+        result = {}
+        for account, symbol in pairs:
+            try:
+                entry = by_account.get(str(account))
+                index = entry[1] if entry else {}
+                result[(account, symbol)] = self._apply_symbol_mapping(index, symbol)
+            except Exception as e:
+                logger.error(f"[MAP_SYMBOL_ERROR] {e}")
+                result[(account, symbol)] = symbol
+        return result
 
     def get_all_symbol_mappings(self) -> dict:
         """
@@ -948,11 +1295,9 @@ class SessionManager:
             dict: {account: {'nickname': ..., 'mappings': [...]}, ...}
         """
         try:
-            import json
-
             result = {}
 
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.read_conn() as conn:
                 rows = conn.execute(
                     """
                     SELECT account, nickname, symbol_mappings
@@ -969,7 +1314,7 @@ class SessionManager:
 
                     if mappings_json:
                         try:
-                            mappings = json.loads(mappings_json)
+                            mappings = _json_loads(mappings_json)
                             if mappings:  # เฉพาะ account ที่มี mappings
                                 result[account] = {
                                     'nickname': nickname,
@@ -1011,29 +1356,39 @@ class SessionManager:
             fname = f"symbol_info_{symbol}.json"
             primary_path = os.path.join(instance_path, "Data", "MQL5", "Files", fname)
             fallback_path = os.path.join(instance_path, "MQL5", "Files", fname)
-            symbol_info_file = primary_path if os.path.exists(primary_path) else fallback_path
 
-            if os.path.exists(symbol_info_file):
-                with open(symbol_info_file, 'r', encoding='utf-8') as f:
-                    symbol_data = json.load(f)
-                logger.debug(f"[SESSION_MANAGER] Symbol info for {symbol}: {symbol_data}")
-                return symbol_data
-            else:
-                # ถ้าไม่มีไฟล์ ให้คืนค่า default
-                logger.warning(f"[SESSION_MANAGER] Symbol info file not found for {symbol}, using defaults")
-                return {
-                    'volume_min': 0.01,
-                    'volume_max': 100.0,
-                    'volume_step': 0.01,
-                    'trade_contract_size': 0.0  # ⚠️ ไม่รู้ค่าจริง
-                }
+            for symbol_info_file in (primary_path, fallback_path):
+                try:
+                    mtime = os.stat(symbol_info_file).st_mtime_ns
+                except OSError:
+                    continue
+
+                # อ่านไฟล์ใหม่เฉพาะเมื่อไฟล์ถูกแก้ไข (mtime เปลี่ยน)
+                cached = self._symbol_info_cache.get(symbol_info_file)
+                if cached is not None and cached[0] == mtime:
+                    symbol_data = cached[1]
+                else:
+                    with open(symbol_info_file, 'r', encoding='utf-8') as f:
+                        symbol_data = _json_loads(f.read())
+                    self._symbol_info_cache[symbol_info_file] = (mtime, symbol_data)
+                    logger.debug(f"[SESSION_MANAGER] Symbol info for {symbol}: {symbol_data}")
+                return dict(symbol_data)
+
+            # ถ้าไม่มีไฟล์ ให้คืนค่า default
+            logger.warning(f"[SESSION_MANAGER] Symbol info file not found for {symbol}, using defaults")
+            return {
+                'volume_min': 0.01,
+                'volume_max': 100.0,
+                'volume_step': 0.01,
+                'trade_contract_size': 0.0  # ⚠️ ไม่รู้ค่าจริง
+            }
 
         except Exception as e:
             logger.error(f"[SESSION_MANAGER] Failed to get symbol info for {account}/{symbol}: {e}")
             return None
 
     def update_account_status(self, account: str, status: str, pid: Optional[int] = None):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.get_conn() as conn:
             if pid is not None:
                 conn.execute(
                     "UPDATE accounts SET status = ?, pid = ? WHERE account = ?",
@@ -1044,7 +1399,6 @@ class SessionManager:
                     "UPDATE accounts SET status = ? WHERE account = ?",
                     (status, account),
                 )
-            conn.commit()
 
     # ---------------------- Paths & Detect ----------------------
     def get_instance_path(self, account: str) -> str:
@@ -1062,15 +1416,48 @@ class SessionManager:
         candidates_root = os.path.join(appdata, "MetaQuotes", "Terminal")
         if not os.path.isdir(candidates_root):
             return None
+
+        # ใช้ผลที่ cache ไว้ถ้า Terminal folder ไม่มีการเพิ่ม/ลบ terminal ตั้งแต่ครั้งก่อน
+        fingerprint = f"{candidates_root}|{os.stat(candidates_root).st_mtime_ns}"
+        try:
+            with self._pool.read_conn() as conn:
+                rows = dict(conn.execute(
+                    "SELECT key, value FROM global_settings "
+                    "WHERE key IN ('profile_source_cache', 'profile_source_cache_mtime')"
+                ).fetchall())
+            cached = rows.get('profile_source_cache')
+            if rows.get('profile_source_cache_mtime') == fingerprint and cached and os.path.isdir(cached):
+                return cached
+        except Exception as e:
+            logger.debug(f"[PROFILE_SOURCE] Cache lookup failed: {e}")
+
+        newest = self._scan_profile_sources(candidates_root)
+
+        try:
+            with self._pool.get_conn() as conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO global_settings (key, value) VALUES (?, ?)",
+                    [('profile_source_cache', newest), ('profile_source_cache_mtime', fingerprint)]
+                )
+                conn.commit()
+        except Exception as e:
+            logger.debug(f"[PROFILE_SOURCE] Cache update failed: {e}")
+
+        return newest
+
+    def _scan_profile_sources(self, candidates_root: str) -> Optional[str]:
+        """หา Terminal folder ที่มี MQL5 และแก้ไขล่าสุด"""
         newest = None
         newest_mtime = 0
-        for child in os.listdir(candidates_root):
-            p = os.path.join(candidates_root, child)
-            if os.path.isdir(p) and os.path.exists(os.path.join(p, "MQL5")):
-                mtime = os.path.getmtime(p)
-                if mtime > newest_mtime:
-                    newest_mtime = mtime
-                    newest = p
+        # DirEntry carries the type/stat info from the directory listing itself
+        with os.scandir(candidates_root) as entries:
+            for entry in entries:
+                if entry.is_dir() and os.path.exists(os.path.join(entry.path, "MQL5")):
+                    mtime = entry.stat().st_mtime
+                    if mtime > newest_mtime:
+                        newest_mtime = mtime
+                        newest = entry.path
         return newest
 
     def diagnose_profile_source(self) -> Dict:
@@ -1167,30 +1554,13 @@ pause
         """Try to find the MT5 process PID for this account"""
         if psutil is None:
             return None
-        
+
         try:
-            instance_path = os.path.abspath(self.get_instance_path(account))
-            
-            for proc in psutil.process_iter(["pid", "name", "exe", "cwd"]):
-                try:
-                    name = (proc.info.get("name") or "").lower()
-                    if name not in ("terminal64.exe", "terminal.exe"):
-                        continue
-                    
-                    exe = proc.info.get("exe") or ""
-                    cwd = proc.info.get("cwd") or ""
-                    
-                    # Check if this process is running from our instance
-                    if (instance_path in os.path.abspath(exe) or 
-                        instance_path in os.path.abspath(cwd)):
-                        return proc.info["pid"]
-                        
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-                    
+            for proc in self._iter_instance_procs(account):
+                return proc.pid
         except Exception as e:
             logger.debug(f"[FIND_PID] Error finding PID for {account}: {e}")
-            
+
         return None
 
     # -------------------- MT5 Process Utils --------------------
@@ -1215,7 +1585,9 @@ pause
                     proc.terminate()
                 except Exception:
                     pass
-            psutil.wait_procs(targets, timeout=3)
+            deadline = time.monotonic() + 3
+            for proc in targets:
+                _wait_for_pid_exit(proc.pid, max(0.0, deadline - time.monotonic()))
             # kill survivors
             survivors = []
             for proc in targets:
@@ -1232,20 +1604,43 @@ pause
         except Exception as e:
             logger.warning(f"[PROCESS] Best-effort close MT5 processes raised: {e}")
 
+    def wait_for_instance_exit(self, account: str, timeout: float = 10.0) -> bool:
+        """
+        รอให้ MT5 process ของ account ปิดทั้งหมด (สำหรับ stop/restart)
+
+        Args:
+            account: หมายเลขบัญชี
+            timeout: เวลารอสูงสุด (วินาที)
+
+        Returns:
+            bool: True ถ้าไม่มี process ของ account เหลืออยู่
+        """
+        deadline = time.monotonic() + timeout
+        for proc in list(self._iter_instance_procs(account)):
+            if not _wait_for_pid_exit(proc.pid, max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
     def _iter_instance_procs(self, account: str):
         if psutil is None:
             return
-        inst = os.path.abspath(self.get_instance_path(account))
-        for proc in psutil.process_iter(["pid", "name", "exe", "cwd"]):
+        inst = os.path.normcase(os.path.abspath(self.get_instance_path(account)))
+        # Only name is fetched up front; exe/cwd are slow on Windows, so they
+        # are read just for the few MT5 terminals
+        for proc in psutil.process_iter(["name"]):
             try:
                 name = (proc.info.get("name") or "").lower()
-                if name not in ("terminal64.exe", "terminal.exe"):
+                if name not in _MT5_TERMINAL_NAMES:
                     continue
-                exe = proc.info.get("exe") or ""
-                cwd = proc.info.get("cwd") or ""
-                if inst in os.path.abspath(exe) or inst in os.path.abspath(cwd):
-                    yield proc
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                for getter in (proc.exe, proc.cwd):
+                    try:
+                        path = getter() or ""
+                    except psutil.AccessDenied:
+                        continue
+                    if inst in os.path.normcase(path):
+                        yield proc
+                        break
+            except psutil.NoSuchProcess:
                 continue
 
     def is_instance_alive(self, account: str) -> bool:
@@ -1254,7 +1649,7 @@ pause
         - สำหรับ Remote Mode: เช็คจาก last_seen (heartbeat)
         - สำหรับ Instance Mode: เช็คจาก PID
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.read_conn() as conn:
             row = conn.execute(
                 "SELECT pid, last_seen, status FROM accounts WHERE account = ?",
                 (account,)
@@ -1265,10 +1660,16 @@ pause
 
             pid, last_seen, status = row
 
+        return self._is_alive_from_row(account, pid, last_seen)
+
+    def _is_alive_from_row(self, account: str, pid: Optional[int], last_seen: Optional[str]) -> bool:
+        """
+        ตัดสินว่า account ยังทำงานอยู่จาก pid / last_seen ที่อ่านมาแล้ว
+        (ใช้ร่วมกันระหว่าง is_instance_alive และ snapshot_accounts)
+        """
         # ตรวจสอบ Remote Mode ก่อน (มี last_seen = เป็น remote account)
         if last_seen:
             try:
-                from datetime import timedelta
                 last_beat = datetime.fromisoformat(last_seen)
                 # ถือว่า alive ถ้า heartbeat ไม่เกิน 30 วินาที
                 is_alive = (datetime.now() - last_beat) < timedelta(seconds=30)
@@ -1289,6 +1690,44 @@ pause
 
         return False
 
+    def snapshot_accounts(self, accounts: List[str]) -> Dict[str, tuple]:
+        """
+        ดึงสถานะของหลาย account ในการ query ครั้งเดียว
+        (แทน account_exists + get_account_info + is_instance_alive ต่อ account)
+
+        Args:
+            accounts: รายการหมายเลขบัญชี
+
+        Returns:
+            Dict: {account: (exists, status, alive)}
+        """
+        if not accounts:
+            return {}
+
+        found = {}
+        with self._pool.read_conn() as conn:
+            for chunk in _chunked(list(accounts)):
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f"SELECT account, status, pid, last_seen FROM accounts WHERE account IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                found.update((str(row[0]), row) for row in rows)
+
+        snapshots = {}
+        for account in accounts:
+            row = found.get(account)
+            if row is None:
+                snapshots[account] = (False, '', False)
+                continue
+
+            status = row[1] or 'Wait for Activate'
+            # ไม่ต้องเช็ค heartbeat ถ้า status เป็น Offline อยู่แล้ว
+            alive = status != 'Offline' and self._is_alive_from_row(account, row[2], row[3])
+            snapshots[account] = (True, status, alive)
+
+        return snapshots
+
     # Note: Multi-User methods (get_accounts_by_user, add_remote_account_with_user,
     # validate_account_ownership, get_account_owner, etc.) are defined earlier
     # in this file right after get_all_accounts() method.
@@ -171,6 +171,10 @@ class SignalTranslator:
             return {}
         
         results: Dict[str, Optional[Dict]] = {}
+
+        # โหลด per-account mappings ของทุกบัญชีในการ query ครั้งเดียว (เข้า cache)
+        if self.session_manager:
+            self.session_manager.get_symbol_mappings_bulk(target_accounts)
         
         for account in target_accounts:
             results[account] = self.translate_for_account(
@@ -4716,7 +4716,11 @@ async removeSymbolMapping(from) {
       es.onmessage = (evt) => {
         try {
           const data = JSON.parse(evt.data);
-          this.addSystemLog(data.type || 'info', data.message || '', data.timestamp);
+          // Bursts arrive batched as {logs: [...]} (oldest first)
+          const logs = Array.isArray(data.logs) ? data.logs : [data];
+          logs.forEach((log) => {
+            this.addSystemLog(log.type || 'info', log.message || '', log.timestamp);
+          });
         } catch (e) {
           console.warn('Invalid system log event:', e);
         }
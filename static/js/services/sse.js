@@ -105,7 +105,9 @@ class SSEService {
         try {
           const data = JSON.parse(evt.data);
           if (onLog) {
-            onLog(data.type || 'info', data.message || '', data.timestamp);
+            // Bursts arrive batched as {logs: [...]} (oldest first)
+            const logs = Array.isArray(data.logs) ? data.logs : [data];
+            logs.forEach((log) => onLog(log.type || 'info', log.message || '', log.timestamp));
           }
         } catch (e) {
           console.warn('Invalid system log event:', e);
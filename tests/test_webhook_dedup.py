@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Test Webhook Duplicate Command Window
+Validates that WebhookService drops exact repeats of a command sent to the
+same account within DUPLICATE_COMMAND_WINDOW seconds, and that the dropped
+signal is reported (history event + webhook response) instead of being
+counted as sent.
+"""
+
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+class _FakeSessionManager:
+    """Every account exists and is online"""
+
+    def snapshot_accounts(self, accounts):
+        return {account: (True, 'Online', True) for account in accounts}
+
+
+class _FakeCommandQueue:
+    """Collects queued commands"""
+
+    def __init__(self):
+        self.commands = []
+
+    def add_command(self, account, command):
+        self.commands.append((account, command))
+        return True
+
+    def add_commands_bulk(self, commands):
+        return [self.add_command(account, command) for account, command in commands]
+
+    def get_queue_size(self, account):
+        return sum(1 for queued, _ in self.commands if queued == account)
+
+
+def _make_service():
+    from app.services.webhook_service import WebhookService
+
+    events = []
+    queue = _FakeCommandQueue()
+    service = WebhookService(_FakeSessionManager(), queue, events.append)
+    return service, queue, events
+
+
+def _payload(**extra):
+    data = {'action': 'BUY', 'symbol': 'XAUUSD', 'volume': 0.01, 'account_number': '111'}
+    data.update(extra)
+    return data
+
+
+def test_repeat_within_window_is_dropped():
+    """Test that a repeated signal is queued once and reported as duplicate"""
+    print("\n📋 Test: Repeat Within Window")
+    print("-" * 40)
+
+    service, queue, events = _make_service()
+
+    first = service.process_webhook(_payload())
+    second = service.process_webhook(_payload())
+    print(f"   First:  {first}")
+    print(f"   Second: {second}")
+
+    assert first == {'success': True, 'message': 'BUY sent to 1/1 accounts'}
+    assert second['success'] is True
+    assert second['message'] == 'BUY sent to 0/1 accounts (1 duplicate dropped)'
+    assert len(queue.commands) == 1
+
+    assert [event['status'] for event in events] == ['success', 'duplicate']
+    assert 'Duplicate BUY dropped' in events[1]['message']
+
+
+def test_repeat_after_window_is_sent():
+    """Test that the same signal is sent again once the window has passed"""
+    print("\n📋 Test: Repeat After Window")
+    print("-" * 40)
+
+    from app.services import webhook_service
+
+    service, queue, events = _make_service()
+    original_window = webhook_service.DUPLICATE_COMMAND_WINDOW
+    webhook_service.DUPLICATE_COMMAND_WINDOW = 0
+    try:
+        service.process_webhook(_payload())
+        result = service.process_webhook(_payload())
+    finally:
+        webhook_service.DUPLICATE_COMMAND_WINDOW = original_window
+
+    print(f"   Result: {result}")
+    assert result == {'success': True, 'message': 'BUY sent to 1/1 accounts'}
+    assert len(queue.commands) == 2
+    assert [event['status'] for event in events] == ['success', 'success']
+
+
+def test_different_command_is_not_dropped():
+    """Test that a command differing in any traded field is sent"""
+    print("\n📋 Test: Different Command")
+    print("-" * 40)
+
+    service, queue, events = _make_service()
+
+    service.process_webhook(_payload())
+    other_volume = service.process_webhook(_payload(volume=0.02))
+    other_account = service.process_webhook(_payload(account_number='222'))
+
+    assert other_volume == {'success': True, 'message': 'BUY sent to 1/1 accounts'}
+    assert other_account == {'success': True, 'message': 'BUY sent to 1/1 accounts'}
+    assert len(queue.commands) == 3
+    print("   ✅ Different volume/account sent")
+
+
+def test_multi_account_partial_duplicate():
+    """Test that a batch reports which accounts were dropped as repeats"""
+    print("\n📋 Test: Multi-Account Batch")
+    print("-" * 40)
+
+    service, queue, events = _make_service()
+
+    service.process_webhook(_payload())
+    data = _payload(accounts=['111', '222'])
+    del data['account_number']
+    result = service.process_webhook(data)
+    print(f"   Result: {result}")
+
+    assert result == {'success': True, 'message': 'BUY sent to 1/2 accounts (1 duplicate dropped)'}
+    assert [account for account, _ in queue.commands] == ['111', '222']
+    assert [(event['account'], event['status']) for event in events[1:]] == [
+        ('111', 'duplicate'), ('222', 'success')
+    ]
+
+
+def main():
+    print("=" * 60)
+    print("🔁 Webhook Duplicate Command Tests")
+    print("=" * 60)
+
+    test_repeat_within_window_is_dropped()
+    test_repeat_after_window_is_sent()
+    test_different_command_is_not_dropped()
+    test_multi_account_partial_duplicate()
+
+    print("\n✅ All duplicate command tests passed!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())